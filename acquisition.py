@@ -0,0 +1,77 @@
+import logging
+import threading
+from typing import Any, Optional
+
+from adaptive_sampling import AdaptiveSampler
+import clock
+from sensor import Sensor
+
+"""
+Background acquisition of sensor readings.
+
+Each sensor is polled on its own thread, so a sensor that blocks waiting for
+data (e.g. the SCD-41 waiting on `data_ready`) never holds up the control loop.
+The control loop only ever consumes the most recently published reading via
+`Sensor.get_current_reading()`.
+
+Sensors with an `AdaptiveSampler` pick the time until their next reading after
+each one instead of polling on a fixed interval.
+"""
+
+
+class SensorPoller(threading.Thread):
+    def __init__(self, sensor: Sensor[Any], interval_seconds: float, sampler: Optional[AdaptiveSampler] = None):
+        super().__init__(name=f"{type(sensor).__name__}-poller", daemon=True)
+        self.sensor = sensor
+        self.interval_seconds = interval_seconds
+        self.sampler = sampler
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        next_poll = clock.monotonic()
+        interval_seconds = self.interval_seconds
+        while not self._stopped.is_set():
+            previous_reading = self.sensor.current_reading
+            try:
+                self.sensor.get_new_reading()
+            except Exception:
+                # a failed read must not kill the poller; the control loop keeps acting on the last published reading.
+                logging.exception(f"Failed to get a new reading from {type(self.sensor).__name__}")
+
+            # the sampler only learns from new readings; feeding it the last one again would flatten its rate estimate,
+            # so after a failed read the sensor keeps its current period until it's read successfully
+            if self.sampler is not None and self.sensor.current_reading is not previous_reading:
+                try:
+                    interval_seconds = self.sampler.next_period()
+                    self.sensor.set_sampling_period(interval_seconds)
+                except Exception:
+                    logging.exception(f"Failed to adapt the sampling period of {type(self.sensor).__name__}")
+
+            # anchor polls to the monotonic clock so read time doesn't add drift to the polling period
+            next_poll += interval_seconds
+            now = clock.monotonic()
+            if next_poll < now:
+                next_poll = now
+            self._stopped.wait(next_poll - now)
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+
+class AcquisitionEngine:
+    def __init__(self) -> None:
+        self._pollers: list[SensorPoller] = []
+
+    def add_sensor(self, sensor: Sensor[Any], interval_seconds: float, sampler: Optional[AdaptiveSampler] = None) -> None:
+        self._pollers.append(SensorPoller(sensor, interval_seconds, sampler))
+
+    def start(self) -> None:
+        for poller in self._pollers:
+            logging.debug(f"Starting {poller.name}")
+            poller.start()
+
+    def stop(self, timeout: float = 1.0) -> None:
+        for poller in self._pollers:
+            poller.stop()
+        for poller in self._pollers:
+            poller.join(timeout)
@@ -0,0 +1,202 @@
+from dataclasses import dataclass
+import logging
+import math
+import threading
+from typing import Any, Optional
+
+import clock
+from controller import gpio
+from controller_types import Settable
+from metrics import ACTUATOR_DUTY_CYCLE, ACTUATOR_ON_SECONDS, ACTUATOR_SWITCHES
+
+"""
+Background driver for the GPIO pins that switch devices.
+
+Control ticks only record the state they want a device in. A single driver
+thread owns the GPIO pins and applies every pending change in one batched
+`GPIO.output(pins, states)` call, so a slow or blocking GPIO write never
+delays a control tick.
+
+Devices can also run at a duty cycle: at 40% over a 30s window, a device is on
+for the first 12s of every window and off for the rest. Pulses shorter than the
+configured minimum are skipped, so relays never chatter.
+"""
+
+
+@dataclass
+class ActuatorStats:
+    switches: int = 0
+    on_seconds: float = 0.0
+    duty_cycle: float = 0.0
+
+
+class Channel:
+    """
+    Driver-side state of a single pin. Only the driver touches a channel's pin state.
+    """
+    def __init__(self, name: str, pin: int):
+        self.name = name
+        self.pin = pin
+        self.duty_cycle = 0.0
+        self.state = False
+        self.stats = ActuatorStats()
+        self.changed_at = clock.monotonic()
+        self._switches = ACTUATOR_SWITCHES.labels(device=name)
+        self._on_seconds = ACTUATOR_ON_SECONDS.labels(device=name)
+        self._duty_cycle = ACTUATOR_DUTY_CYCLE.labels(device=name)
+
+    def set_duty_cycle(self, duty_cycle: float) -> None:
+        self.duty_cycle = duty_cycle
+        self.stats.duty_cycle = duty_cycle
+        self._duty_cycle.set(duty_cycle)
+
+    def account(self, now: float) -> None:
+        if self.state:
+            self.stats.on_seconds += now - self.changed_at
+            self._on_seconds.inc(now - self.changed_at)
+        self.changed_at = now
+
+    def switched(self, state: bool, now: float) -> None:
+        self.account(now)
+        self.state = state
+        self.stats.switches += 1
+        self._switches.inc()
+
+
+class ActuatorDriver(threading.Thread):
+    def __init__(self, window_seconds: float = 30.0, min_pulse_seconds: float = 1.0, gpio_module: Optional[Any] = None):
+        super().__init__(name='actuator-driver', daemon=True)
+        self.window_seconds = window_seconds
+        self.min_pulse_seconds = min_pulse_seconds
+        self._gpio = gpio_module or gpio()
+        self._channels: list[Channel] = []
+        self._changed = threading.Condition()
+        self._pending = False
+        self._stopped = False
+        # duty cycle windows are anchored to when the driver was created
+        self._epoch = clock.monotonic()
+
+    def output(self, name: str, pin: int, on_duty_cycle: float = 1.0) -> 'DrivenOutput':
+        """
+        Sets up `pin` as an output and returns a `Settable` for the device on it.
+        """
+        self._gpio.setup(pin, self._gpio.OUT)
+        channel = Channel(name, pin)
+        with self._changed:
+            self._channels.append(channel)
+        return DrivenOutput(self, channel, on_duty_cycle)
+
+    def set_duty_cycle(self, channel: Channel, duty_cycle: float) -> None:
+        if not 0.0 <= duty_cycle <= 1.0:
+            raise ValueError(f"Duty cycle must be between 0 and 1, got {duty_cycle}")
+        with self._changed:
+            channel.set_duty_cycle(duty_cycle)
+            self._pending = True
+            self._changed.notify()
+
+    def stats(self) -> dict[str, ActuatorStats]:
+        with self._changed:
+            now = clock.monotonic()
+            for channel in self._channels:
+                channel.account(now)
+            return {channel.name: ActuatorStats(**vars(channel.stats)) for channel in self._channels}
+
+    def run(self) -> None:
+        while True:
+            with self._changed:
+                stopped = self._stopped
+                if stopped:
+                    # leave every device off once the driver stops
+                    for channel in self._channels:
+                        channel.set_duty_cycle(0.0)
+                self._pending = False
+                now = clock.monotonic()
+                changes, next_edge = self._changes_at(now)
+
+            # GPIO writes happen outside the lock, so control ticks setting devices never wait on them
+            if changes:
+                next_edge = self._write(changes, now, next_edge)
+            if stopped:
+                return
+
+            with self._changed:
+                if not self._pending and not self._stopped:
+                    self._changed.wait(None if next_edge is None else max(0.0, next_edge - clock.monotonic()))
+
+    def stop(self, timeout: float = 1.0) -> None:
+        with self._changed:
+            self._stopped = True
+            self._changed.notify()
+        self.join(timeout)
+
+    def _changes_at(self, now: float) -> tuple[list[tuple[Channel, bool]], Optional[float]]:
+        """
+        Channels whose pin should change state at `now`, and the time of the next duty cycle edge, if any.
+        """
+        window_start = self._epoch + math.floor((now - self._epoch) / self.window_seconds) * self.window_seconds
+        changes = []
+        next_edge = None
+        for channel in self._channels:
+            state, edge = self._state_at(channel.duty_cycle, now, window_start)
+            if edge is not None and (next_edge is None or edge < next_edge):
+                next_edge = edge
+            if state != channel.state:
+                changes.append((channel, state))
+        return changes, next_edge
+
+    def _write(self, changes: list[tuple[Channel, bool]], now: float, next_edge: Optional[float]) -> Optional[float]:
+        """
+        Writes every change in a single GPIO call, returning when the driver should next wake up.
+        """
+        try:
+            self._gpio.output([channel.pin for channel, _ in changes], [state for _, state in changes])
+        except Exception:
+            logging.exception(f"Failed to write GPIO pins {[channel.pin for channel, _ in changes]}, retrying")
+            retry_at = now + 1.0
+            return retry_at if next_edge is None else min(next_edge, retry_at)
+
+        with self._changed:
+            for channel, state in changes:
+                channel.switched(state, now)
+        return next_edge
+
+    def _state_at(self, duty_cycle: float, now: float, window_start: float) -> tuple[bool, Optional[float]]:
+        """
+        Whether a channel at `duty_cycle` should be on at `now`, and when it next needs to change.
+        """
+        on_seconds = duty_cycle * self.window_seconds
+        if on_seconds < self.min_pulse_seconds:
+            return False, None
+        if self.window_seconds - on_seconds < self.min_pulse_seconds:
+            return True, None
+        on_until = window_start + on_seconds
+        if now < on_until:
+            return True, on_until
+        return False, window_start + self.window_seconds
+
+
+class DrivenOutput(Settable):
+    """
+    Device switched by an `ActuatorDriver`. Switching it on runs it at `on_duty_cycle`.
+    """
+    def __init__(self, driver: ActuatorDriver, channel: Channel, on_duty_cycle: float = 1.0):
+        self._driver = driver
+        self._channel = channel
+        self.on_duty_cycle = on_duty_cycle
+        self._state = False
+
+    def set(self, state: bool) -> None:
+        self._state = state
+        self._driver.set_duty_cycle(self._channel, self.on_duty_cycle if state else 0.0)
+
+    def set_on_duty_cycle(self, on_duty_cycle: float) -> None:
+        """
+        Changes the duty cycle the device runs at while on, taking effect immediately if it's on now.
+        """
+        self.on_duty_cycle = on_duty_cycle
+        if self._state:
+            self._driver.set_duty_cycle(self._channel, on_duty_cycle)
+
+    def set_duty_cycle(self, duty_cycle: float) -> None:
+        self._state = duty_cycle > 0
+        self._driver.set_duty_cycle(self._channel, duty_cycle)
@@ -0,0 +1,69 @@
+from collections import deque
+
+import clock
+from config import AdaptiveSamplingConfig
+from controller_types import MonodirectionalController
+from history import Samples, rate_of_change
+
+"""
+Adaptive sampling periods for sensors that feed controllers.
+
+A sensor only needs to be read often while one of its controllers is close to
+switching. Each controller's distance to its switching point is projected
+forward at the measure's recent rate of change, and the sensor is sampled again
+after a fraction of the shortest projected time, within configured bounds. Far
+from any threshold this backs off to the longest period, cutting I2C traffic and
+sensor self-heating, while near a threshold it samples as often as it used to.
+"""
+
+
+class AdaptiveSampler:
+    def __init__(self, config: AdaptiveSamplingConfig, controllers: list[MonodirectionalController]):
+        self.config = config
+        self.controllers = controllers
+        # recent readings of each controller's measure, only ever taken from fresh sensor readings
+        self._samples: list[Samples] = [deque() for _ in controllers]
+        self._device_states = [controller.active for controller in controllers]
+
+    def next_period(self) -> float:
+        """
+        How long to wait before taking the next reading. Call once after each new reading from the sensor,
+        and not after failed reads or reads that returned no new reading.
+        """
+        now = clock.monotonic()
+        device_states = [controller.active for controller in self.controllers]
+        if device_states != self._device_states:
+            # any device switching changes how every measure in the chamber moves (the exhaust dries the air, too),
+            # so readings from before the switch no longer say anything about where the measures are heading
+            for samples in self._samples:
+                samples.clear()
+            self._device_states = device_states
+
+        period = self.config.max_period_seconds
+        for controller, samples in zip(self.controllers, self._samples):
+            try:
+                samples.append((now, controller.reader()))
+            except IOError:
+                return self.config.min_period_seconds
+            while samples[0][0] < now - self.config.rate_window_seconds:
+                samples.popleft()
+            period = min(period, self._period_for(controller, samples))
+        return period
+
+    def _period_for(self, controller: MonodirectionalController, samples: Samples) -> float:
+        _, value = samples[-1]
+        if controller.should_be_active(value) != controller.active:
+            # the controller is about to switch; keep readings coming until it has
+            return self.config.min_period_seconds
+        if len(samples) < 2 or samples[0][0] == samples[-1][0]:
+            # not enough readings since the last switch to tell where the measure is heading
+            return self.config.min_period_seconds
+
+        distance = abs(controller.switching_point() - value)
+        # a measure moving away from the switching point can turn around as soon as a device switches,
+        # so the projection assumes it's heading towards it either way
+        rate = abs(rate_of_change(samples))
+        if rate == 0:
+            return self.config.max_period_seconds
+        period = self.config.safety_factor * distance / rate
+        return min(self.config.max_period_seconds, max(self.config.min_period_seconds, period))
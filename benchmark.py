@@ -0,0 +1,288 @@
+import argparse
+from dataclasses import asdict, dataclass
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable
+
+from prometheus_client import REGISTRY, generate_latest
+
+import clock
+from clock import VirtualClock
+from config import SensorConfig
+from controller import CO2Controller, TemperatureMonitor
+from metrics import GREENHOUSE_STATE
+from simulation import ChamberModel, ChamberProbe, SimulatedAHT20, SimulatedOutput, SimulatedSCD41
+
+"""
+Benchmarks for the control loop's per-tick hot path.
+
+Everything runs against simulated sensors and devices, so the suite runs
+anywhere, including the low-end boards we deploy to. Results are written as
+JSON so runs can be compared across versions:
+
+    python benchmark.py --output bench.json
+    python benchmark.py --output new.json --compare bench.json
+"""
+
+# a benchmark builds its fixtures and returns the operation to time
+Benchmark = Callable[[], Callable[[], object]]
+BENCHMARKS: dict[str, Benchmark] = {}
+
+
+def benchmark(name: str) -> Callable[[Benchmark], Benchmark]:
+    def register(setup: Benchmark) -> Benchmark:
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    iterations: int
+    mean_ns: float
+    median_ns: float
+    p99_ns: float
+    max_ns: float
+
+    """
+    Bytes still allocated after the run, averaged over iterations; nonzero values point at per-tick leaks.
+    """
+    retained_bytes_per_call: float
+
+    """
+    Peak memory allocated over the baseline at any point during the run.
+    """
+    peak_bytes: int
+
+
+def _chamber():
+    chamber = ChamberModel()
+    scd41 = SimulatedSCD41(SensorConfig(), ChamberProbe(chamber, ['co2_ppm', 'temp_c', 'relative_humidity_100']))
+    aht20 = SimulatedAHT20(SensorConfig(), ChamberProbe(chamber, ['temp_c', 'relative_humidity_100']))
+    scd41.get_new_reading()
+    aht20.get_new_reading()
+    return chamber, scd41, aht20
+
+
+def _co2_controller():
+    chamber, scd41, _ = _chamber()
+    return CO2Controller(
+        config={
+            'target_side_of_threshold': 'below',
+            'threshold_value': 850,
+            'zero_energy_band': 100,
+        },
+        sensor=scd41,
+        device=SimulatedOutput(chamber, 'exhaust_on'),
+    )
+
+
+@benchmark('sensor.get_new_reading')
+def bench_get_new_reading():
+    _, scd41, _ = _chamber()
+    return scd41.get_new_reading
+
+
+@benchmark('monitor.read_value')
+def bench_read_value():
+    _, _, aht20 = _chamber()
+    return TemperatureMonitor(sensor=aht20).read_value
+
+
+@benchmark('controller.control_state')
+def bench_control_state():
+    return _co2_controller().control_state
+
+
+@benchmark('controller.should_be_active')
+def bench_should_be_active():
+    controller = _co2_controller()
+    return lambda: controller.should_be_active(900.0)
+
+
+@benchmark('metrics.measure_value')
+def bench_measure_value_metric():
+    return lambda: GREENHOUSE_STATE.set_measure('co2', 900.0)
+
+
+@benchmark('metrics.device_active')
+def bench_device_active_metric():
+    return lambda: GREENHOUSE_STATE.set_device_active('exhaust_fan', 'co2', True)
+
+
+@benchmark('metrics.scrape')
+def bench_scrape():
+    _co2_controller().control_state()
+    return lambda: generate_latest(REGISTRY)
+
+
+def run_benchmark(name: str, iterations: int) -> BenchmarkResult:
+    operation = BENCHMARKS[name]()
+    for _ in range(min(iterations, 1000)):
+        operation()
+
+    timings = []
+    gc.disable()
+    try:
+        for _ in range(iterations):
+            started = time.perf_counter_ns()
+            operation()
+            timings.append(time.perf_counter_ns() - started)
+    finally:
+        gc.enable()
+
+    gc.collect()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    for _ in range(iterations):
+        operation()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    return BenchmarkResult(
+        name=name,
+        iterations=iterations,
+        mean_ns=statistics.fmean(timings),
+        median_ns=float(statistics.median(timings)),
+        p99_ns=float(timings[min(len(timings) - 1, int(len(timings) * 0.99))]),
+        max_ns=float(timings[-1]),
+        retained_bytes_per_call=(current - baseline) / iterations,
+        peak_bytes=peak - baseline,
+    )
+
+
+# Startup path of `tempcontrol` up to its first control decision, with simulated sensors and outputs standing in for
+# the hardware. Prints the seconds elapsed since the wall-clock time passed as its first argument.
+STARTUP_SCRIPT = """
+import sys
+import time
+
+from tempcontrol import controllers, get_config_from_file
+from config import SensorConfig
+from simulation import ChamberModel, ChamberProbe, SimulatedAHT20, SimulatedOutput, SimulatedSCD41
+
+config = get_config_from_file(sys.argv[2])
+chamber = ChamberModel()
+scd41 = SimulatedSCD41(config.scd41, ChamberProbe(chamber, ['co2_ppm', 'temp_c', 'relative_humidity_100']))
+aht20 = SimulatedAHT20(config.aht20, ChamberProbe(chamber, ['temp_c', 'relative_humidity_100']))
+scd41.get_new_reading()
+aht20.get_new_reading()
+device_controllers = controllers(
+    config,
+    aht20,
+    scd41,
+    humidifier=SimulatedOutput(chamber, 'fogger_on'),
+    exhaust=SimulatedOutput(chamber, 'exhaust_on'),
+)
+for controller in device_controllers.values():
+    controller.control_state()
+print(time.time() - float(sys.argv[1]))
+"""
+
+
+def run_startup_benchmark(config_path: str, runs: int, cached: bool) -> BenchmarkResult:
+    """
+    Measures time from process launch to the first control decision, in fresh interpreters.
+    With `cached` unset, the parsed config cache is removed before every run, as after the config file changes.
+    """
+    cache_path = f"{config_path}.cache"
+    if cached:
+        # make sure the cache is warm before timing anything
+        subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, str(time.time()), config_path], check=True, capture_output=True)
+
+    timings = []
+    for _ in range(runs):
+        if not cached and os.path.exists(cache_path):
+            os.remove(cache_path)
+        launched_at = time.time()
+        process = subprocess.run(
+            [sys.executable, '-c', STARTUP_SCRIPT, str(launched_at), config_path],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        timings.append(float(process.stdout.strip().splitlines()[-1]) * 1e9)
+
+    timings.sort()
+    return BenchmarkResult(
+        name='startup.cached_config' if cached else 'startup.cold_config',
+        iterations=runs,
+        mean_ns=statistics.fmean(timings),
+        median_ns=float(statistics.median(timings)),
+        p99_ns=float(timings[min(len(timings) - 1, int(len(timings) * 0.99))]),
+        max_ns=float(timings[-1]),
+        retained_bytes_per_call=0.0,
+        peak_bytes=0,
+    )
+
+
+def compare(results: list[BenchmarkResult], baseline_path: str, tolerance: float) -> bool:
+    """
+    Prints each benchmark's change in median latency against a previous run.
+    Returns False if any benchmark regressed by more than `tolerance` (as a fraction).
+    """
+    with open(baseline_path) as baseline_file:
+        baseline = {result['name']: result for result in json.load(baseline_file)['results']}
+
+    passed = True
+    for result in results:
+        previous = baseline.get(result.name)
+        if previous is None:
+            print(f"{result.name}: no baseline")
+            continue
+        change = result.median_ns / previous['median_ns'] - 1
+        regressed = change > tolerance
+        passed = passed and not regressed
+        print(f"{result.name}: {change:+.1%} median{' REGRESSION' if regressed else ''}")
+    return passed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the control loop hot path.")
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--output', help="Path to write JSON results to")
+    parser.add_argument('--compare', help="Previous JSON results to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="Allowed fractional slowdown in median latency")
+    parser.add_argument('--startup-runs', type=int, default=0, help="Also time this many process startups to the first control decision")
+    parser.add_argument('--config', default='config.yaml', help="Config used by the startup benchmarks")
+    parser.add_argument('benchmarks', nargs='*', help="Benchmarks to run (default: all)")
+    args = parser.parse_args()
+
+    # per-reading info logs would otherwise be written for every iteration
+    logging.getLogger().setLevel(logging.WARNING)
+    clock.use(VirtualClock())
+
+    results = []
+    for name in args.benchmarks or BENCHMARKS:
+        result = run_benchmark(name, args.iterations)
+        results.append(result)
+        print(f"{name}: median {result.median_ns / 1000:.2f}us, p99 {result.p99_ns / 1000:.2f}us, retained {result.retained_bytes_per_call:.1f}B/call")
+
+    if args.startup_runs:
+        for cached in (False, True):
+            result = run_startup_benchmark(args.config, args.startup_runs, cached)
+            results.append(result)
+            print(f"{result.name}: median {result.median_ns / 1e6:.1f}ms, max {result.max_ns / 1e6:.1f}ms")
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({
+                'created_at': time.time(),
+                'python': sys.version,
+                'platform': platform.platform(),
+                'machine': platform.machine(),
+                'results': [asdict(result) for result in results],
+            }, output, indent=2)
+
+    if args.compare and not compare(results, args.compare, args.tolerance):
+        sys.exit(1)
@@ -0,0 +1,70 @@
+import time as _time
+from typing import Protocol
+
+"""
+Source of time for the control loop.
+
+Everything that timestamps readings or schedules work reads the time through
+this module rather than `time` directly, so a simulation can swap in a
+`VirtualClock` and run the loop faster than real time.
+"""
+
+
+class Clock(Protocol):
+    def time(self) -> float: ...
+
+    def monotonic(self) -> float: ...
+
+    def sleep(self, seconds: float) -> None: ...
+
+
+class SystemClock(Clock):
+    def time(self) -> float:
+        return _time.time()
+
+    def monotonic(self) -> float:
+        return _time.monotonic()
+
+    def sleep(self, seconds: float) -> None:
+        _time.sleep(max(0.0, seconds))
+
+
+class VirtualClock(Clock):
+    """
+    Clock that only moves when told to. Sleeping advances the clock instantly.
+    """
+    def __init__(self, epoch: float = 0.0):
+        self.epoch = epoch
+        self._elapsed = 0.0
+
+    def time(self) -> float:
+        return self.epoch + self._elapsed
+
+    def monotonic(self) -> float:
+        return self._elapsed
+
+    def sleep(self, seconds: float) -> None:
+        self._elapsed += max(0.0, seconds)
+
+    def advance_to(self, monotonic: float) -> None:
+        self._elapsed = max(self._elapsed, monotonic)
+
+
+_current: Clock = SystemClock()
+
+
+def use(clock: Clock) -> None:
+    global _current
+    _current = clock
+
+
+def time() -> float:
+    return _current.time()
+
+
+def monotonic() -> float:
+    return _current.monotonic()
+
+
+def sleep(seconds: float) -> None:
+    _current.sleep(seconds)
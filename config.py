@@ -1,5 +1,28 @@
-from dataclasses import dataclass
-from dataclass_wizard import YAMLWizard
+from dataclasses import dataclass, field
+import logging
+import os
+import pickle
+from typing import Optional
+
+
+@dataclass
+class PredictiveConfig:
+    """
+    How far ahead to project the measure's current rate of change when deciding whether to switch off early.
+    Usually around the controller's period, so the measure can't overshoot between decisions.
+    """
+    lookahead_seconds: float = 5.0
+
+    """
+    Shortest time the device stays on, or off, after switching.
+    """
+    min_on_seconds: float = 30.0
+    min_off_seconds: float = 30.0
+
+    """
+    How far back to look when estimating the measure's rate of change.
+    """
+    rate_window_seconds: float = 60.0
 
 
 @dataclass
@@ -8,6 +31,16 @@ class HumidifierConfig:
     minimum_humidity_pct: float
     zero_energy_band: float
 
+    """
+    Fraction of each actuator window the humidifier runs for while switched on.
+    """
+    duty_cycle: float = 1.0
+
+    """
+    When set, the humidifier is driven by the predictive controller instead of plain hysteresis.
+    """
+    predictive: Optional[PredictiveConfig] = None
+
 
 @dataclass
 class ExhaustConfig:
@@ -15,6 +48,43 @@ class ExhaustConfig:
     maximum_co2_ppm: int
     zero_energy_band: int
 
+    """
+    Fraction of each actuator window the exhaust fan runs for while switched on.
+    """
+    duty_cycle: float = 1.0
+
+    """
+    When set, the exhaust is driven by the predictive controller instead of plain hysteresis.
+    """
+    predictive: Optional[PredictiveConfig] = None
+
+
+@dataclass
+class ChamberConfig:
+    name: str
+    humidifier: HumidifierConfig
+    exhaust: ExhaustConfig
+
+
+@dataclass
+class AdaptiveSamplingConfig:
+    """
+    Shortest and longest time allowed between readings.
+    """
+    min_period_seconds: float = 5.0
+    max_period_seconds: float = 60.0
+
+    """
+    Fraction of the projected time until a measure reaches its controller's next switching point
+    to wait before sampling again. Lower values react sooner at the cost of more readings.
+    """
+    safety_factor: float = 0.5
+
+    """
+    How far back to look when estimating how quickly a measure is changing.
+    """
+    rate_window_seconds: float = 120.0
+
 
 @dataclass
 class SensorConfig:
@@ -24,12 +94,311 @@ class SensorConfig:
     poll_interval_seconds: float = 5.0
     read_timeout: float = 120.0
 
+    """
+    How often to take a new reading from the sensor.
+    Defaults to the greenhouse's `update_interval_seconds`.
+    """
+    period_seconds: Optional[float] = None
+
+    """
+    When set, the time between readings adapts to how close the sensor's controllers are to switching,
+    replacing `period_seconds`.
+    """
+    adaptive: Optional[AdaptiveSamplingConfig] = None
+
+    """
+    Readings older than this are too stale to act on. Controllers keep their device in its current state
+    until a fresh reading arrives, rather than switching it on an old value.
+    """
+    stale_after_seconds: float = 180.0
+
+
+@dataclass
+class ReadingLogConfig:
+    path: str = 'readings.log'
+
+    """
+    Size of each log segment file. Segments are preallocated, so this is also the on-disk footprint of each one.
+    """
+    segment_bytes: int = 4 * 1024 * 1024
+
+    """
+    How many rotated segments to keep alongside the active one.
+    """
+    segments_kept: int = 4
+
+    """
+    How often buffered records are flushed to disk.
+    Records written since the last flush can be lost on power failure.
+    """
+    flush_interval_seconds: float = 300.0
+
+
+@dataclass
+class FusionConfig:
+    """
+    Age at which a sensor's reading counts for half as much as a fresh one.
+    """
+    freshness_half_life_seconds: float = 30.0
+
+    """
+    How long a reading can take before the sensor is treated as hung, and its last reading is left out.
+    Counted on top of however long the sensor can legitimately wait for its next measurement,
+    e.g. up to two low power measurement intervals for the SCD-41 after it switches mode.
+    """
+    max_read_seconds: float = 10.0
+
+    """
+    Largest disagreement between sensors, after correcting for their usual offset from each other,
+    before the one that moved is treated as drifting and left out until they agree again.
+    """
+    max_disagreement: float = 10.0
+
+    """
+    How quickly the usual offset between sensors follows slow changes, e.g. as the SCD-41 warms up.
+    """
+    offset_time_constant_seconds: float = 3600.0
+
 
 @dataclass
-class GreenhouseConfig(YAMLWizard):
+class OutlierFilterConfig:
+    """
+    Largest jump from the last accepted reading that isn't treated as an outlier.
+    """
+    max_deviation: float
+
+    """
+    Number of outliers in a row after which the jump is taken to be a real change, and accepted.
+    """
+    max_consecutive_rejections: int = 3
+
+
+@dataclass
+class MedianFilterConfig:
+    """
+    Number of readings the rolling median is taken over.
+    """
+    window: int = 5
+
+
+@dataclass
+class RateLimitFilterConfig:
+    max_rate_per_second: float
+
+
+@dataclass
+class EMAFilterConfig:
+    """
+    Time for the moving average to cover ~63% of a step change in the readings.
+    """
+    time_constant_seconds: float
+
+
+@dataclass
+class FilterConfig:
+    """
+    Filters applied to a measure's readings before they're acted on. Configured filters always run in this order.
+    """
+    outlier: Optional[OutlierFilterConfig] = None
+    median: Optional[MedianFilterConfig] = None
+    rate_limit: Optional[RateLimitFilterConfig] = None
+    ema: Optional[EMAFilterConfig] = None
+
+
+@dataclass
+class ActuatorConfig:
+    """
+    Length of the window devices running below a 100% duty cycle are pulsed over.
+    """
+    window_seconds: float = 30.0
+
+    """
+    Shortest on or off pulse a device will be driven for; shorter pulses are dropped.
+    """
+    min_pulse_seconds: float = 1.0
+
+
+@dataclass
+class DisplayConfig:
+    i2c_address: int = 0x3C
+    width: int = 128
+    height: int = 64
+    max_fps: float = 2.0
+
+
+@dataclass
+class GreenhouseConfig:
     humidifier: HumidifierConfig
     exhaust: ExhaustConfig
-    scd41: SensorConfig = SensorConfig()
-    aht20: SensorConfig = SensorConfig()
+    scd41: SensorConfig = field(default_factory=lambda: SensorConfig(period_seconds=5.0))
+    aht20: SensorConfig = field(default_factory=SensorConfig)
     update_interval_seconds: float = 10.0
     metrics_server_port: int = 9100
+
+    """
+    Number of samples of history kept in memory for each measure. The default keeps a day of history at a 10s period.
+    """
+    history_capacity: int = 8640
+
+    """
+    When set, every reading and actuation is appended to an on-disk log.
+    """
+    reading_log: Optional[ReadingLogConfig] = None
+
+    """
+    Additional grow chambers, each with its own humidifier and exhaust settings.
+    The top-level `humidifier` and `exhaust` blocks configure the primary chamber.
+    Only simulation.py drives additional chambers so far; tempcontrol.py warns about and ignores them.
+    """
+    chambers: list[ChamberConfig] = field(default_factory=list)
+
+    """
+    When set, the HUD is shown on an SSD1306-style OLED on the I2C bus.
+    """
+    display: Optional[DisplayConfig] = None
+
+    actuator: ActuatorConfig = field(default_factory=ActuatorConfig)
+
+    """
+    Filters for each measure's readings, keyed by measure name (e.g. `co2`, `relative_humidity`).
+    """
+    filters: dict[str, FilterConfig] = field(default_factory=dict)
+
+    """
+    When set, humidity is controlled from both the SCD-41 and AHT20 readings, failing over to either one
+    if the other fails, hangs or drifts. Otherwise it's controlled from the SCD-41 alone.
+    """
+    humidity_fusion: Optional[FusionConfig] = None
+
+    @classmethod
+    def from_yaml_file(cls, path: str) -> 'GreenhouseConfig':
+        # the YAML and dataclass-wizard stacks take a noticeable share of startup on a Pi Zero,
+        # so they're only imported when a config actually needs parsing
+        import yaml
+        from dataclass_wizard import fromdict
+
+        with open(path) as config_file:
+            return fromdict(cls, yaml.safe_load(config_file))
+
+
+def validate_config(config: GreenhouseConfig) -> None:
+    """
+    Checks that a parsed config is safe to run with, raising a `ValueError` listing every problem found.
+    """
+    problems = []
+    for name, humidifier, exhaust in [
+        ('primary chamber', config.humidifier, config.exhaust),
+        *((f"chamber {chamber.name}", chamber.humidifier, chamber.exhaust) for chamber in config.chambers),
+    ]:
+        if not 0 <= humidifier.minimum_humidity_pct <= 100:
+            problems.append(f"{name}: minimum_humidity_pct must be between 0 and 100, got {humidifier.minimum_humidity_pct}")
+        if humidifier.zero_energy_band < 0:
+            problems.append(f"{name}: humidifier zero_energy_band can't be negative, got {humidifier.zero_energy_band}")
+        if exhaust.maximum_co2_ppm <= 0:
+            problems.append(f"{name}: maximum_co2_ppm must be positive, got {exhaust.maximum_co2_ppm}")
+        if exhaust.zero_energy_band < 0:
+            problems.append(f"{name}: exhaust zero_energy_band can't be negative, got {exhaust.zero_energy_band}")
+        for device, duty_cycle in (('humidifier', humidifier.duty_cycle), ('exhaust', exhaust.duty_cycle)):
+            if not 0 < duty_cycle <= 1:
+                problems.append(f"{name}: {device} duty_cycle must be in (0, 1], got {duty_cycle}")
+        for device, predictive in (('humidifier', humidifier.predictive), ('exhaust', exhaust.predictive)):
+            if predictive is None:
+                continue
+            if predictive.lookahead_seconds < 0 or predictive.min_on_seconds < 0 or predictive.min_off_seconds < 0:
+                problems.append(f"{name}: {device} predictive lookahead and minimum on/off times can't be negative")
+            if predictive.rate_window_seconds <= 0:
+                problems.append(f"{name}: {device} predictive rate_window_seconds must be positive, got {predictive.rate_window_seconds}")
+
+    for name, sensor in (('scd41', config.scd41), ('aht20', config.aht20)):
+        if sensor.poll_interval_seconds <= 0:
+            problems.append(f"{name}: poll_interval_seconds must be positive, got {sensor.poll_interval_seconds}")
+        if sensor.read_timeout <= 0:
+            problems.append(f"{name}: read_timeout must be positive, got {sensor.read_timeout}")
+        if sensor.period_seconds is not None and sensor.period_seconds <= 0:
+            problems.append(f"{name}: period_seconds must be positive, got {sensor.period_seconds}")
+        adaptive = sensor.adaptive
+        if adaptive is not None:
+            if not 0 < adaptive.min_period_seconds <= adaptive.max_period_seconds:
+                problems.append(f"{name}: adaptive periods must satisfy 0 < min_period_seconds <= max_period_seconds")
+            if not 0 < adaptive.safety_factor <= 1:
+                problems.append(f"{name}: adaptive safety_factor must be in (0, 1], got {adaptive.safety_factor}")
+            if adaptive.rate_window_seconds <= 0:
+                problems.append(f"{name}: adaptive rate_window_seconds must be positive, got {adaptive.rate_window_seconds}")
+        if adaptive is not None:
+            longest_period = adaptive.max_period_seconds
+        else:
+            longest_period = sensor.period_seconds or config.update_interval_seconds
+        if sensor.stale_after_seconds <= longest_period:
+            problems.append(
+                f"{name}: stale_after_seconds must be longer than the time between readings ({longest_period}s), "
+                f"got {sensor.stale_after_seconds}"
+            )
+
+    if config.update_interval_seconds <= 0:
+        problems.append(f"update_interval_seconds must be positive, got {config.update_interval_seconds}")
+    if config.history_capacity < 1:
+        problems.append(f"history_capacity must be positive, got {config.history_capacity}")
+    if config.actuator.window_seconds <= 0:
+        problems.append(f"actuator: window_seconds must be positive, got {config.actuator.window_seconds}")
+    if not 0 <= config.actuator.min_pulse_seconds < config.actuator.window_seconds / 2:
+        problems.append("actuator: min_pulse_seconds must be non-negative and less than half of window_seconds")
+    for measure, filter_config in config.filters.items():
+        if filter_config.outlier is not None:
+            if filter_config.outlier.max_deviation <= 0:
+                problems.append(f"filters.{measure}: outlier max_deviation must be positive, got {filter_config.outlier.max_deviation}")
+            if filter_config.outlier.max_consecutive_rejections < 1:
+                problems.append(f"filters.{measure}: outlier max_consecutive_rejections must be at least 1")
+        if filter_config.median is not None and filter_config.median.window < 1:
+            problems.append(f"filters.{measure}: median window must be at least 1, got {filter_config.median.window}")
+        if filter_config.rate_limit is not None and filter_config.rate_limit.max_rate_per_second <= 0:
+            problems.append(f"filters.{measure}: rate_limit max_rate_per_second must be positive, got {filter_config.rate_limit.max_rate_per_second}")
+        if filter_config.ema is not None and filter_config.ema.time_constant_seconds <= 0:
+            problems.append(f"filters.{measure}: ema time_constant_seconds must be positive, got {filter_config.ema.time_constant_seconds}")
+    fusion = config.humidity_fusion
+    if fusion is not None:
+        for name in ('freshness_half_life_seconds', 'max_read_seconds', 'max_disagreement', 'offset_time_constant_seconds'):
+            if getattr(fusion, name) <= 0:
+                problems.append(f"humidity_fusion: {name} must be positive, got {getattr(fusion, name)}")
+    if config.display is not None and config.display.max_fps <= 0:
+        problems.append(f"display: max_fps must be positive, got {config.display.max_fps}")
+
+    if problems:
+        raise ValueError("Invalid config: " + "; ".join(problems))
+
+
+def _cache_key(path: str) -> tuple:
+    # the config classes' own source is part of the key, so code changes invalidate cached configs too
+    config_stat = os.stat(path)
+    module_stat = os.stat(__file__)
+    return (os.path.abspath(path), config_stat.st_mtime_ns, config_stat.st_size, module_stat.st_mtime_ns)
+
+
+def load_config(path: str, cache_path: Optional[str] = None) -> GreenhouseConfig:
+    """
+    Loads and validates the config at `path`.
+
+    Validated configs are pickled to `cache_path` (by default alongside the config), keyed by the config file's
+    modification time, so restarts skip parsing YAML entirely until the file changes.
+    """
+    cache_path = cache_path or f"{path}.cache"
+    key = _cache_key(path)
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            cached_key, config = pickle.load(cache_file)
+        if cached_key == key:
+            return config
+    except FileNotFoundError:
+        pass
+    except Exception:
+        logging.warning(f"Ignoring unreadable config cache {cache_path}", exc_info=True)
+
+    config = GreenhouseConfig.from_yaml_file(path)
+    validate_config(config)
+    try:
+        # write to a temporary file first so a crash mid-write can't leave a truncated cache behind
+        with open(f"{cache_path}.tmp", 'wb') as cache_file:
+            pickle.dump((key, config), cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{cache_path}.tmp", cache_path)
+    except OSError:
+        logging.warning(f"Unable to write config cache {cache_path}", exc_info=True)
+    return config
@@ -0,0 +1,80 @@
+import logging
+import os
+import threading
+from typing import Callable, Optional
+
+from config import GreenhouseConfig, validate_config
+
+"""
+Hot reloading of the greenhouse config.
+
+Parsing and validating a config happens on a watcher thread, never in a
+signal handler or on the control loop. The watcher reloads whenever the config
+file's modification time changes, or when asked to (e.g. on SIGHUP), and keeps
+the newest valid config until the control loop takes it between ticks.
+Invalid configs are logged and ignored, leaving the running config in place.
+"""
+
+
+class ConfigWatcher(threading.Thread):
+    def __init__(self, path: str, load: Callable[[str], GreenhouseConfig], poll_interval_seconds: float = 2.0):
+        super().__init__(name='config-watcher', daemon=True)
+        self.path = path
+        self.poll_interval_seconds = poll_interval_seconds
+        self._load = load
+        self._reload_requested = threading.Event()
+        self._stopped = False
+        self._pending: Optional[GreenhouseConfig] = None
+        self._pending_lock = threading.Lock()
+        self._modified_at = self._modification_time()
+
+    def request_reload(self) -> None:
+        """
+        Asks the watcher to reload the config even if the file hasn't changed.
+        Only sets a flag, so it's safe to call from a signal handler.
+        """
+        self._reload_requested.set()
+
+    def take_pending(self) -> Optional[GreenhouseConfig]:
+        """
+        Returns the newest validated config not yet taken, or None if there isn't one.
+        """
+        with self._pending_lock:
+            config, self._pending = self._pending, None
+            return config
+
+    def run(self) -> None:
+        while not self._stopped:
+            requested = self._reload_requested.wait(self.poll_interval_seconds)
+            self._reload_requested.clear()
+            if self._stopped:
+                return
+
+            modified_at = self._modification_time()
+            if modified_at is None:
+                # editors often replace the file rather than writing it in place; wait for the new one to appear
+                continue
+            if not requested and modified_at == self._modified_at:
+                continue
+            self._modified_at = modified_at
+
+            try:
+                config = self._load(self.path)
+                validate_config(config)
+            except Exception:
+                logging.exception(f"Ignoring invalid config in {self.path}, keeping the running config")
+                continue
+
+            logging.info(f"Loaded new config from {self.path}")
+            with self._pending_lock:
+                self._pending = config
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._reload_requested.set()
+
+    def _modification_time(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
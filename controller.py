@@ -1,34 +1,43 @@
 from dataclasses import dataclass
 import importlib.util
-try:
-    # necessary to be able to do development on
-    importlib.util.find_spec('RPi.GPIO')
-    import RPi.GPIO as GPIO
-except ImportError:
-    import FakeRPi.GPIO as GPIO
 from typing import Literal
 
 from controller_types import (
     DeviceController,
+    FusedMonitor,
     MonodirectionalController,
+    PredictiveController,
     AHTMonitor,
     SCDMonitor,
     Settable,
 )
 
 
+def gpio():
+    """
+    Imports the GPIO library on first use, so controllers can be imported (e.g. for simulation) without GPIO access.
+    """
+    try:
+        # necessary to be able to do development on
+        importlib.util.find_spec('RPi.GPIO')
+        import RPi.GPIO as GPIO
+    except ImportError:
+        import FakeRPi.GPIO as GPIO
+    return GPIO
+
+
 class PinOutput(Settable):
     def __init__(self, pin: int):
         self._pin = pin
-        GPIO.setup(self._pin, GPIO.OUT)
+        self._gpio = gpio()
+        self._gpio.setup(self._pin, self._gpio.OUT)
 
     def set(self, state: bool) -> None:
-        GPIO.output(self._pin, state)
+        self._gpio.output(self._pin, state)
 
 
 @dataclass
-class HumidityController(MonodirectionalController, DeviceController, SCDMonitor):
-    target_reading: Literal['relative_humidity_100'] = 'relative_humidity_100'
+class HumidityController(MonodirectionalController, DeviceController, FusedMonitor):
     measure_name = "relative_humidity"
     device_name = "humidifier"
 
@@ -38,18 +47,33 @@ class CO2Controller(MonodirectionalController, DeviceController, SCDMonitor):
     target_reading: Literal['co2_ppm'] = 'co2_ppm'
     measure_name = "co2"
     device_name = "exhaust_fan"
+    # the SCD-41 produces a new CO2 reading every 5s in periodic measurement mode
+    period_seconds = 5.0
+    wake_on_reading = True
+
+
+@dataclass
+class PredictiveHumidityController(PredictiveController, HumidityController):
+    pass
+
+
+@dataclass
+class PredictiveCO2Controller(PredictiveController, CO2Controller):
+    pass
 
 
 @dataclass
 class TemperatureMonitor(AHTMonitor):
     target_reading: Literal['temp_c'] = 'temp_c'
     measure_name = "temp"
+    period_seconds = 60.0
 
 
 @dataclass
 class SCDTemperatureMonitor(SCDMonitor):
     target_reading: Literal['temp_c'] = 'temp_c'
     measure_name = "temp_scd"
+    period_seconds = 60.0
 
 
 @dataclass
@@ -0,0 +1,57 @@
+import numpy as np
+
+from controller_types import MonodirectionalControllerConfig
+
+"""
+Vectorized evaluation of many monodirectional controllers at once.
+
+A `ControllerBank` holds the thresholds, zero-energy bands, target sides and
+active flags of N controllers in arrays, and makes all N hysteresis decisions
+in a single step with the same semantics as
+`MonodirectionalController.should_be_active`.
+"""
+
+
+class ControllerBank:
+    def __init__(self, configs: list[MonodirectionalControllerConfig]):
+        size = len(configs)
+        self.thresholds = np.zeros(size, dtype=np.float64)
+        self.zero_energy_bands = np.zeros(size, dtype=np.float64)
+        # True where the controller keeps its measure below the threshold
+        self.below = np.zeros(size, dtype=bool)
+        self.active = np.zeros(size, dtype=bool)
+        for index, config in enumerate(configs):
+            self.update_config(index, config)
+
+    def __len__(self) -> int:
+        return len(self.thresholds)
+
+    def update_config(self, index: int, config: MonodirectionalControllerConfig) -> None:
+        self.thresholds[index] = config['threshold_value']
+        self.zero_energy_bands[index] = config['zero_energy_band']
+        self.below[index] = config['target_side_of_threshold'] == 'below'
+
+    def should_be_active(self, values: np.ndarray) -> np.ndarray:
+        """
+        Returns whether each controller should be active for its value.
+
+        Active controllers turn off as soon as they're back past their threshold,
+        inactive ones only turn on once they're past it by at least their zero-energy band.
+        A NaN value (e.g. a failed read) leaves that controller in its current state.
+        """
+        margin = np.where(self.active, 0.0, self.zero_energy_bands)
+        targets = np.where(
+            self.below,
+            values > self.thresholds + margin,
+            values < self.thresholds - margin,
+        )
+        return np.where(np.isnan(values), self.active, targets)
+
+    def step(self, values: np.ndarray) -> np.ndarray:
+        """
+        Evaluates every controller, records the new states and returns the indices of controllers that switched.
+        """
+        targets = self.should_be_active(values)
+        switched = np.flatnonzero(targets != self.active)
+        self.active = targets
+        return switched
@@ -1,15 +1,25 @@
 from abc import ABC, abstractmethod, abstractproperty
+from collections import deque
 from dataclasses import dataclass, field
+from functools import cached_property
 import logging
-from typing import Literal, Protocol, TypedDict
+from operator import attrgetter
+from typing import Any, Callable, Literal, Optional, Protocol, TypedDict
 
+import clock
+from filters import FilterPipeline
+from fusion import FusedSource
+from history import HISTORY, Samples, linear_trend
 from metrics import (
-    MEASURE_VALUE,
-    DEVICE_ACTIVE,
-    DEVICE_THRESHOLD,
-    DEVICE_ZERO_ENERGY_BAND,
+    CONTROL_READING_AGE_SECONDS,
+    CONTROL_STALE_READINGS,
+    CONTROL_STATE_SECONDS,
+    DEVICE_SWITCHES,
+    GREENHOUSE_STATE,
+    PREDICTIVE_OVERRIDES,
 )
-from sensor import SCD41, AHT20, SCD41ReadingKey, AHT20ReadingKey
+from reading_log import READING_LOG, DEVICE_RECORD, MEASURE_RECORD
+from sensor import SCD41, AHT20, SCD41Reading, AHT20Reading, SCD41ReadingKey, AHT20ReadingKey, Sensor
 
 
 class Settable(Protocol):
@@ -22,6 +32,23 @@ class Monitor(ABC):
     """
     measure_name: str
 
+    """
+    How often the monitor should run, and how long after each release it has to finish.
+    When unset, the period falls back to the greenhouse's `update_interval_seconds` and the deadline to the period.
+    """
+    period_seconds: Optional[float] = None
+    deadline_seconds: Optional[float] = None
+
+    """
+    Whether the monitor should run as soon as its sensor publishes a new reading instead of on a fixed period.
+    """
+    wake_on_reading: bool = False
+
+    """
+    Filters the monitor's readings are run through before it reports or acts on them, if any.
+    """
+    filters: Optional[FilterPipeline] = None
+
     """
     Function that returns the current value of the target measurement.
     The function is expected to handle waiting for a value from the sensor.
@@ -30,9 +57,33 @@ class Monitor(ABC):
     @abstractmethod
     def reader(self) -> float: ...
 
+    def reading_age(self) -> Optional[float]:
+        """
+        Seconds since the reading behind `reader()`'s current value was taken, if the monitor knows it.
+        """
+        return None
+
+    def max_reading_age(self) -> Optional[float]:
+        """
+        Age in seconds past which the monitor's readings are too stale to act on, if it has a limit.
+        """
+        return None
+
+    def sensors(self) -> list[Sensor[Any]]:
+        """
+        Sensors whose readings the monitor reads from.
+        """
+        return []
+
     def read_value(self) -> float:
         current_value = self.reader()
-        MEASURE_VALUE.labels(measure=self.measure_name).set(current_value)
+        if self.filters is None:
+            GREENHOUSE_STATE.set_measure(self.measure_name, current_value)
+        else:
+            GREENHOUSE_STATE.set_measure(self.measure_name, current_value, self.filters.raw_value)
+        # history is kept on the monotonic clock, like every other in-process timestamp; the on-disk log uses wall-clock time
+        HISTORY.series(self.measure_name).append(clock.monotonic(), current_value)
+        READING_LOG.append(MEASURE_RECORD, self.measure_name, current_value)
         logging.info(f"{self.measure_name}: {current_value}")
 
         return current_value
@@ -59,26 +110,65 @@ class Controller(Monitor, ABC):
     @abstractmethod
     def should_be_active(self, value: float) -> bool: ...
 
+    def decide(self, value: float) -> bool:
+        """
+        Makes the control decision for a freshly read value. Called exactly once per control tick,
+        so unlike `should_be_active` it may keep track of past decisions.
+        """
+        return self.should_be_active(value)
+
     """
     Loop that handles reading the measure value, toggling the device based on
     the result of should_be_active, and
     """
     def control_state(self) -> None:
+        started_at = clock.monotonic()
         try:
+            self._control_state()
+        finally:
+            self._control_state_seconds.observe(clock.monotonic() - started_at)
+
+    def _control_state(self) -> None:
+        try:
+            # the reading's age is checked first, so a stale value never makes it into the history or the log
+            reading_age = self.reading_age()
+            if reading_age is not None:
+                self._reading_age_seconds.observe(reading_age)
+                max_reading_age = self.max_reading_age()
+                if max_reading_age is not None and reading_age > max_reading_age:
+                    logging.warning(f"{self.measure_name} reading is {reading_age:.0f}s old, remaining in current state")
+                    self._stale_readings.inc()
+                    return
             current_value = self.read_value()
         except IOError:
             logging.warning(f"Failed to read a new measure value for {self.measure_name}, remaining in current state")
             return
-        target_state = self.should_be_active(current_value)
-        DEVICE_ACTIVE.labels(
-            device=self.device_name,
-            measure=self.measure_name,
-        ).set(1 if target_state else 0)
+        target_state = self.decide(current_value)
+        GREENHOUSE_STATE.set_device_active(self.device_name, self.measure_name, target_state)
+        READING_LOG.append(DEVICE_RECORD, self.device_name, 1.0 if target_state else 0.0)
         logging.debug(f"{self.device_name}: {target_state}")
         if self.active != target_state:
             logging.debug(f"Switching {self.measure_name} controller to {'active' if target_state else 'inactive'}")
             self.toggle(target_state)
             self.active = target_state
+            self._switches.inc()
+
+    # metric children are bound on first use, once the device name is known
+    @cached_property
+    def _control_state_seconds(self):
+        return CONTROL_STATE_SECONDS.labels(device=self.device_name)
+
+    @cached_property
+    def _reading_age_seconds(self):
+        return CONTROL_READING_AGE_SECONDS.labels(device=self.device_name)
+
+    @cached_property
+    def _stale_readings(self):
+        return CONTROL_STALE_READINGS.labels(device=self.device_name)
+
+    @cached_property
+    def _switches(self):
+        return DEVICE_SWITCHES.labels(device=self.device_name, measure=self.measure_name)
 
 
 class MonodirectionalControllerConfig(TypedDict):
@@ -113,8 +203,11 @@ class MonodirectionalController(Controller):
         self._report_threshold()
 
     def should_be_active(self, value: float) -> bool:
+        return self._hysteresis(value, self.active)
+
+    def _hysteresis(self, value: float, active: bool) -> bool:
         # if the controller is already active, it'll turn back off once we're past our threshold.
-        if self.active:
+        if active:
             if self.config['target_side_of_threshold'] == 'below':
                 return value > self.config['threshold_value']
             return value < self.config['threshold_value']
@@ -125,17 +218,154 @@ class MonodirectionalController(Controller):
 
         return value < self.config['threshold_value'] - self.config['zero_energy_band']
 
+    def switching_point(self) -> float:
+        """
+        Measure value at which the controller will next switch its device, given whether it's currently active.
+        """
+        if self.active:
+            return self.config['threshold_value']
+        if self.config['target_side_of_threshold'] == 'below':
+            return self.config['threshold_value'] + self.config['zero_energy_band']
+        return self.config['threshold_value'] - self.config['zero_energy_band']
+
     def _report_threshold(self) -> None:
-        DEVICE_THRESHOLD.labels(
-            device=self.device_name,
-            measure=self.measure_name,
-            target=self.config['target_side_of_threshold'],
-        ).set(self.config['threshold_value'])
-        DEVICE_ZERO_ENERGY_BAND.labels(
-            device=self.device_name,
-            measure=self.measure_name,
-            target=self.config['target_side_of_threshold'],
-        ).set(self.config['zero_energy_band'])
+        GREENHOUSE_STATE.set_threshold(
+            self.device_name,
+            self.measure_name,
+            self.config['target_side_of_threshold'],
+            self.config['threshold_value'],
+            self.config['zero_energy_band'],
+        )
+
+
+class PredictiveControllerConfig(TypedDict):
+    """
+    How far ahead to project the measure's current rate of change when deciding whether to switch off early.
+    Usually around the controller's period, so the measure can't overshoot between decisions.
+    """
+    lookahead_seconds: float
+
+    """
+    Shortest time the device stays on, or off, after switching.
+    """
+    min_on_seconds: float
+    min_off_seconds: float
+
+    """
+    How far back to look when estimating the measure's rate of change.
+    """
+    rate_window_seconds: float
+
+
+@dataclass
+class PredictiveController(MonodirectionalController):
+    """
+    Hysteresis controller that acts on the measure's trend rather than on single readings.
+
+    Readings are fitted with a least-squares line over a short window, which smooths out sensor noise
+    and gives the measure's rate of change. The device is switched off early if the trend will reach
+    the threshold within `lookahead_seconds`, preventing overshoot, and is only switched on while the
+    measure is still heading away from its target; a measure that's already on its way back is left alone.
+    The trend only overrides plain hysteresis while the reading is inside the hysteresis band: a reading past
+    either edge of the band switches the device exactly as plain hysteresis would.
+    Once switched, the device holds its state for a minimum time to protect relays from rapid cycling.
+
+    Every time a decision departs from what plain hysteresis would have done with the same reading
+    and device state, it's counted as either a held or an early switch.
+    """
+    predictive: PredictiveControllerConfig = field(default_factory=lambda: {
+        'lookahead_seconds': 5.0,
+        'min_on_seconds': 30.0,
+        'min_off_seconds': 30.0,
+        'rate_window_seconds': 60.0,
+    })
+
+    """
+    Switches plain hysteresis would have made that this controller held off on, and switches it made early.
+    """
+    held_switches: int = field(init=False, default=0)
+    early_switches: int = field(init=False, default=0)
+
+    def __post_init__(self):
+        super().__post_init__()
+        self._samples: Samples = deque()
+        self._switched_at = float('-inf')
+        self._override: Optional[str] = None
+
+    def should_be_active(self, value: float) -> bool:
+        trend, rate = self._trend(value)
+        if not self._in_band(value):
+            target_state = self._hysteresis(value, self.active)
+        elif self.active:
+            target_state = self._hysteresis(trend + rate * self.predictive['lookahead_seconds'], True)
+        else:
+            heading_away = rate >= 0 if self.config['target_side_of_threshold'] == 'below' else rate <= 0
+            target_state = heading_away and self._hysteresis(trend, False)
+
+        held_for = clock.monotonic() - self._switched_at
+        min_held = self.predictive['min_on_seconds'] if self.active else self.predictive['min_off_seconds']
+        if target_state != self.active and held_for < min_held:
+            return self.active
+        return target_state
+
+    def decide(self, value: float) -> bool:
+        target_state = self.should_be_active(value)
+
+        override = None
+        if target_state != self._hysteresis(value, self.active):
+            override = 'held' if target_state == self.active else 'early'
+        if override is not None and override != self._override:
+            # a departure lasting several ticks still only stands in for a single hysteresis switch
+            if override == 'held':
+                self.held_switches += 1
+            else:
+                self.early_switches += 1
+            PREDICTIVE_OVERRIDES.labels(device=self.device_name, measure=self.measure_name, decision=override).inc()
+        self._override = override
+
+        read_at = self._read_at()
+        if not self._samples or read_at > self._samples[-1][0]:
+            self._samples.append((read_at, value))
+        while self._samples[0][0] < read_at - self.predictive['rate_window_seconds']:
+            self._samples.popleft()
+        return target_state
+
+    def toggle(self, state: bool) -> None:
+        super().toggle(state)
+        self._switched_at = clock.monotonic()
+        # the measure starts moving differently once the device switches, so older readings no longer predict it
+        self._samples.clear()
+
+    def _in_band(self, value: float) -> bool:
+        """
+        Whether the value lies between the threshold and the point the device switches on at.
+        """
+        threshold = self.config['threshold_value']
+        if self.config['target_side_of_threshold'] == 'below':
+            return threshold <= value <= threshold + self.config['zero_energy_band']
+        return threshold - self.config['zero_energy_band'] <= value <= threshold
+
+    def _trend(self, value: float) -> tuple[float, float]:
+        """
+        Fitted current value and rate of change of the measure, taking `value` as its newest reading.
+        """
+        samples = self._samples.copy()
+        read_at = self._read_at()
+        if not samples or read_at > samples[-1][0]:
+            samples.append((read_at, value))
+        if len(samples) < 2:
+            return value, 0.0
+        return linear_trend(samples)
+
+    def _read_at(self) -> float:
+        """
+        Monotonic time the current reading was taken, so re-reading an old reading doesn't look like a new sample.
+        """
+        try:
+            reading_age = self.reading_age()
+        except IOError:
+            reading_age = None
+        return clock.monotonic() - (reading_age or 0.0)
 
 
 @dataclass
@@ -146,7 +376,23 @@ class SCDMonitor(Monitor, ABC):
     def target_reading(self) -> SCD41ReadingKey: ...
 
     def reader(self):
-        return self.sensor.get_current_reading()[self.target_reading]
+        reading = self.sensor.get_current_reading()
+        if self.filters is None:
+            return self._read_target(reading)
+        return self.filters.apply(reading.timestamp, reading.sequence, self._read_target(reading))
+
+    def reading_age(self):
+        return self.sensor.get_reading_age()
+
+    def max_reading_age(self):
+        return self.sensor.config.stale_after_seconds
+
+    def sensors(self):
+        return [self.sensor]
+
+    @cached_property
+    def _read_target(self) -> Callable[[SCD41Reading], float]:
+        return attrgetter(self.target_reading)
 
 
 @dataclass
@@ -157,7 +403,46 @@ class AHTMonitor(Monitor, ABC):
     def target_reading(self) -> AHT20ReadingKey: ...
 
     def reader(self):
-        return self.sensor.get_current_reading()[self.target_reading]
+        reading = self.sensor.get_current_reading()
+        if self.filters is None:
+            return self._read_target(reading)
+        return self.filters.apply(reading.timestamp, reading.sequence, self._read_target(reading))
+
+    def reading_age(self):
+        return self.sensor.get_reading_age()
+
+    def max_reading_age(self):
+        return self.sensor.config.stale_after_seconds
+
+    def sensors(self):
+        return [self.sensor]
+
+    @cached_property
+    def _read_target(self) -> Callable[[AHT20Reading], float]:
+        return attrgetter(self.target_reading)
+
+
+@dataclass
+class FusedMonitor(Monitor, ABC):
+    """
+    Monitor of a measure read by several sensors, which keeps reading as long as any one of them is healthy.
+    """
+    source: FusedSource
+
+    def reader(self):
+        reading = self.source.get_current_reading()
+        if self.filters is None:
+            return reading.value
+        return self.filters.apply(reading.timestamp, reading.sequence, reading.value)
+
+    def reading_age(self):
+        return self.source.get_reading_age()
+
+    def max_reading_age(self):
+        return self.source.max_reading_age()
+
+    def sensors(self):
+        return self.source.sensors
 
 
 @dataclass
@@ -0,0 +1,172 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left, insort
+from collections import deque
+from math import exp
+import threading
+from typing import Optional
+
+from config import FilterConfig
+from metrics import MEASURE_FILTER_REJECTIONS
+
+"""
+Streaming filters applied to a monitor's readings before it acts on them.
+
+Each stage takes one sample at a time and keeps a fixed amount of state, so
+filtering a reading costs the same however long the process has been running.
+Stages are chained into a `FilterPipeline`, which runs once per new sensor
+reading: monitors that re-read the same reading get the same filtered value
+back, and stages never see a reading twice.
+
+Time-based stages work from each reading's monotonic timestamp rather than a
+sample count, since the time between readings changes with adaptive sampling.
+"""
+
+
+class FilterStage(ABC):
+    """
+    Takes the next sample of a measure and returns the stage's output,
+    or None if the sample is rejected and shouldn't be passed on.
+    """
+    @abstractmethod
+    def update(self, timestamp: float, value: float) -> Optional[float]: ...
+
+
+class OutlierRejection(FilterStage):
+    """
+    Drops samples that jump further than `max_deviation` from the last accepted one.
+    A jump that persists past `max_consecutive_rejections` samples is a real change, and is accepted.
+    """
+    def __init__(self, max_deviation: float, max_consecutive_rejections: int = 3):
+        self.max_deviation = max_deviation
+        self.max_consecutive_rejections = max_consecutive_rejections
+        self._accepted: Optional[float] = None
+        self._rejections = 0
+
+    def update(self, timestamp, value):
+        if (
+            self._accepted is not None
+            and abs(value - self._accepted) > self.max_deviation
+            and self._rejections < self.max_consecutive_rejections
+        ):
+            self._rejections += 1
+            return None
+        self._accepted = value
+        self._rejections = 0
+        return value
+
+
+class RollingMedian(FilterStage):
+    """
+    Median of the last `window` samples. Until the window fills up, the median of the samples seen so far.
+    """
+    def __init__(self, window: int):
+        self.window = window
+        self._samples: deque[float] = deque()
+        # the same samples, kept sorted so the median is a lookup
+        self._sorted: list[float] = []
+
+    def update(self, timestamp, value):
+        if len(self._samples) == self.window:
+            del self._sorted[bisect_left(self._sorted, self._samples.popleft())]
+        self._samples.append(value)
+        insort(self._sorted, value)
+
+        middle = len(self._sorted) // 2
+        if len(self._sorted) % 2:
+            return self._sorted[middle]
+        return (self._sorted[middle - 1] + self._sorted[middle]) / 2
+
+
+class RateLimit(FilterStage):
+    """
+    Follows the samples, but moves by at most `max_rate_per_second` for each second between them.
+    """
+    def __init__(self, max_rate_per_second: float):
+        self.max_rate_per_second = max_rate_per_second
+        self._value: Optional[float] = None
+        self._timestamp = 0.0
+
+    def update(self, timestamp, value):
+        if self._value is None:
+            self._value = value
+        else:
+            max_step = self.max_rate_per_second * (timestamp - self._timestamp)
+            self._value += min(max(value - self._value, -max_step), max_step)
+        self._timestamp = timestamp
+        return self._value
+
+
+class ExponentialMovingAverage(FilterStage):
+    """
+    Exponential moving average with a time constant rather than a fixed weight per sample,
+    so it smooths the same amount however often the sensor is read.
+    """
+    def __init__(self, time_constant_seconds: float):
+        self.time_constant_seconds = time_constant_seconds
+        self._value: Optional[float] = None
+        self._timestamp = 0.0
+
+    def update(self, timestamp, value):
+        if self._value is None:
+            self._value = value
+        else:
+            weight = 1.0 - exp(-(timestamp - self._timestamp) / self.time_constant_seconds)
+            self._value += weight * (value - self._value)
+        self._timestamp = timestamp
+        return self._value
+
+
+class FilterPipeline:
+    def __init__(self, measure_name: str, stages: list[FilterStage]):
+        self.measure_name = measure_name
+        self.stages = stages
+
+        # latest raw and filtered values; the filtered value is None until a sample makes it through every stage
+        self.raw_value: Optional[float] = None
+        self.value: Optional[float] = None
+
+        # readings are filtered from both the control loop and the acquisition threads, e.g. by adaptive samplers
+        self._lock = threading.Lock()
+        self._sequence: Optional[int] = None
+        self._rejections = MEASURE_FILTER_REJECTIONS.labels(measure=measure_name)
+
+    @classmethod
+    def from_config(cls, measure_name: str, config: FilterConfig) -> 'FilterPipeline':
+        """
+        Builds the pipeline for a measure, running its configured stages in a fixed order:
+        outlier rejection, rolling median, rate limit, then moving average.
+        """
+        stages: list[FilterStage] = []
+        if config.outlier is not None:
+            stages.append(OutlierRejection(config.outlier.max_deviation, config.outlier.max_consecutive_rejections))
+        if config.median is not None:
+            stages.append(RollingMedian(config.median.window))
+        if config.rate_limit is not None:
+            stages.append(RateLimit(config.rate_limit.max_rate_per_second))
+        if config.ema is not None:
+            stages.append(ExponentialMovingAverage(config.ema.time_constant_seconds))
+        return cls(measure_name, stages)
+
+    def apply(self, timestamp: float, sequence: int, value: float) -> float:
+        """
+        Filtered value of the measure as of the reading with the given `sequence` number.
+        Raises an `IOError` if no sample has made it through the pipeline yet.
+        """
+        with self._lock:
+            if sequence != self._sequence:
+                self._sequence = sequence
+                self.raw_value = value
+                self._update(timestamp, value)
+            if self.value is None:
+                raise IOError(f"No filtered {self.measure_name} value available.")
+            return self.value
+
+    def _update(self, timestamp: float, value: float) -> None:
+        filtered: Optional[float] = value
+        for stage in self.stages:
+            filtered = stage.update(timestamp, filtered)
+            if filtered is None:
+                # the rejected sample is dropped, and the measure keeps its last filtered value
+                self._rejections.inc()
+                return
+        self.value = filtered
@@ -0,0 +1,240 @@
+from math import exp
+import logging
+from operator import attrgetter
+import threading
+from typing import Any, Callable, NamedTuple, Optional
+
+import clock
+from config import FusionConfig
+from metrics import FUSION_SOURCE_EXCLUSIONS, FUSION_SOURCE_WEIGHT
+from sensor import Sensor
+
+"""
+Fusion of a measure read by more than one sensor.
+
+Each sensor's latest reading is corrected by its usual offset from the primary
+(first) sensor, then averaged with a weight that halves with every
+`freshness_half_life_seconds` it's older than the freshest reading. Sensors are
+left out entirely while their last read failed, while a read has been hanging
+for longer than `max_read_seconds` past any wait for the sensor's next
+measurement, or while they've drifted away from the others. Sensors are
+compared for drift as of the time of the oldest reading, interpolating the
+others between their last two readings, so a sensor sampled less often isn't
+mistaken for drifting while the measure ramps. That way a single misbehaving
+sensor is failed over from on the very next control tick,
+rather than once its reading goes stale.
+
+If every sensor is unhealthy, the fused value falls back to all of them, so a
+source with a single sensor behaves exactly like reading that sensor directly.
+"""
+
+REASONS = ('failed', 'hung', 'drift')
+
+
+class FusedReading(NamedTuple):
+    """
+    Combined reading of a fused measure. The timestamp is that of the freshest reading that went into it,
+    and the sequence number changes whenever any of the sensors publishes a new reading.
+    """
+    timestamp: float
+    sequence: int
+    value: float
+
+
+class FusionInput:
+    """
+    A single sensor's contribution to a fused measure.
+    """
+    def __init__(self, measure_name: str, sensor: Sensor[Any], field: str):
+        self.sensor = sensor
+        self.read_field: Callable[[Any], float] = attrgetter(field)
+
+        # difference between the primary sensor and this one, added to this sensor's values before they're combined
+        self.offset: Optional[float] = None
+
+        # corrected value at the last reading the sensors agreed on, used to tell which one drifted
+        self.last_agreed: Optional[float] = None
+
+        self.excluded_for: Optional[str] = None
+
+        # last two distinct readings of the sensor, newest first, to interpolate between
+        self.reading: Optional[Any] = None
+        self.previous_reading: Optional[Any] = None
+
+        self._weight = FUSION_SOURCE_WEIGHT.labels(measure=measure_name, sensor=sensor.name)
+        self._exclusions = {reason: FUSION_SOURCE_EXCLUSIONS.labels(measure=measure_name, sensor=sensor.name, reason=reason) for reason in REASONS}
+
+    def exclude(self, reason: Optional[str]) -> None:
+        if reason == self.excluded_for:
+            return
+        if reason is None:
+            logging.info(f"{self.sensor.name} is healthy again, including it in the fused measure")
+        else:
+            logging.warning(f"Leaving {self.sensor.name} out of the fused measure ({reason})")
+            self._exclusions[reason].inc()
+        self.excluded_for = reason
+
+    def set_weight(self, weight: float) -> None:
+        self._weight.set(weight)
+
+    def observe(self, reading: Any) -> None:
+        if reading is not self.reading:
+            self.previous_reading = self.reading
+            self.reading = reading
+
+    def value_at(self, timestamp: float) -> Optional[float]:
+        """
+        Uncorrected value of the measure at the given time, no later than the latest reading,
+        interpolated between the last two readings. None if there's no reading from before that time.
+        """
+        reading, previous = self.reading, self.previous_reading
+        if reading is None:
+            return None
+        if reading.timestamp <= timestamp:
+            return self.read_field(reading)
+        if previous is None or previous.timestamp > timestamp:
+            return None
+        fraction = (timestamp - previous.timestamp) / (reading.timestamp - previous.timestamp)
+        return self.read_field(previous) + fraction * (self.read_field(reading) - self.read_field(previous))
+
+
+class FusedSource:
+    def __init__(self, measure_name: str, inputs: list[tuple[Sensor[Any], str]], config: Optional[FusionConfig] = None):
+        """
+        Fuses the given field of each sensor's readings. The first sensor is the primary one,
+        whose scale the fused value is reported in.
+        """
+        self.measure_name = measure_name
+        self.config = config or FusionConfig()
+        self.inputs = [FusionInput(measure_name, sensor, field) for sensor, field in inputs]
+        self.inputs[0].offset = 0.0
+
+        # readings are fused from both the control loop and the acquisition threads, e.g. by adaptive samplers
+        self._lock = threading.Lock()
+        self._learned_sequence: Optional[int] = None
+        self._learned_at: Optional[float] = None
+
+    @property
+    def sensors(self) -> list[Sensor[Any]]:
+        return [fusion_input.sensor for fusion_input in self.inputs]
+
+    def get_current_reading(self) -> FusedReading:
+        """
+        Raises an `IOError` if none of the sensors has a reading yet.
+        """
+        with self._lock:
+            now = clock.monotonic()
+            readings = []
+            for fusion_input in self.inputs:
+                reading = fusion_input.sensor.current_reading
+                if reading is not None:
+                    fusion_input.observe(reading)
+                    readings.append((fusion_input, reading))
+            if not readings:
+                raise IOError(f"No {self.measure_name} reading available from any sensor.")
+
+            sequence = sum(reading.sequence for _, reading in readings)
+            self._check_health(readings, now)
+            if sequence != self._learned_sequence:
+                self._learn_offsets(readings, now)
+                self._learned_sequence = sequence
+
+            healthy = [(fusion_input, reading) for fusion_input, reading in readings if fusion_input.excluded_for is None]
+            used = healthy or readings
+            # weighed by age relative to the freshest reading, so the weights can't all underflow to zero
+            # however long every sensor has been unreachable
+            freshest = max(reading.timestamp for _, reading in used)
+            weights = {
+                fusion_input: 0.5 ** ((freshest - reading.timestamp) / self.config.freshness_half_life_seconds)
+                for fusion_input, reading in used
+            }
+            total_weight = sum(weights.values())
+            value = sum(weights[fusion_input] / total_weight * self._corrected(fusion_input, reading) for fusion_input, reading in used)
+            for fusion_input in self.inputs:
+                fusion_input.set_weight(weights.get(fusion_input, 0.0) / total_weight)
+            return FusedReading(freshest, sequence, value)
+
+    def get_reading_age(self) -> float:
+        """
+        Seconds since the freshest reading that goes into the fused value was taken.
+        Raises an `IOError` if none of the sensors has a reading yet.
+        """
+        return clock.monotonic() - self.get_current_reading().timestamp
+
+    def max_reading_age(self) -> float:
+        return max(sensor.config.stale_after_seconds for sensor in self.sensors)
+
+    def _corrected(self, fusion_input: FusionInput, reading: Any) -> float:
+        # a sensor whose offset hasn't been learned yet, because the primary has no reading, is taken as-is
+        return fusion_input.read_field(reading) + (fusion_input.offset or 0.0)
+
+    def _check_health(self, readings: list[tuple[FusionInput, Any]], now: float) -> None:
+        responsive = []
+        for fusion_input, reading in readings:
+            read_started_at = fusion_input.sensor.read_started_at
+            if fusion_input.sensor.failing:
+                fusion_input.exclude('failed')
+            elif read_started_at is not None and now - read_started_at > self.config.max_read_seconds + fusion_input.sensor.max_wait_seconds():
+                fusion_input.exclude('hung')
+            elif fusion_input.offset is None:
+                # there's nothing to compare a sensor to until its offset from the primary is known
+                fusion_input.exclude(None)
+            else:
+                responsive.append((fusion_input, reading))
+
+        # readings taken at different times can disagree just because the measure moved in between,
+        # so every sensor is compared as of the oldest reading
+        compared_at = min((reading.timestamp for _, reading in responsive), default=now)
+        comparable = []
+        for fusion_input, _ in responsive:
+            value = fusion_input.value_at(compared_at)
+            if value is not None:
+                comparable.append((fusion_input, value + (fusion_input.offset or 0.0)))
+            elif fusion_input.excluded_for != 'drift':
+                # a sensor that can't be compared yet keeps any drift exclusion until it can
+                fusion_input.exclude(None)
+
+        if len(comparable) < 2:
+            # with nothing to compare against, drift can neither be detected nor ruled out
+            for fusion_input, _ in comparable:
+                if fusion_input.excluded_for != 'drift':
+                    fusion_input.exclude(None)
+            return
+
+        values = [value for _, value in comparable]
+        if max(values) - min(values) <= self.config.max_disagreement:
+            for fusion_input, value in comparable:
+                fusion_input.exclude(None)
+                fusion_input.last_agreed = value
+            return
+
+        def moved(item: tuple[FusionInput, float]) -> float:
+            fusion_input, value = item
+            return 0.0 if fusion_input.last_agreed is None else abs(value - fusion_input.last_agreed)
+
+        # the sensor that moved furthest since they last agreed is the one that drifted; on a tie, the primary is kept
+        drifted, _ = max(reversed(comparable), key=moved)
+        for fusion_input, _ in comparable:
+            fusion_input.exclude('drift' if fusion_input is drifted else None)
+
+    def _learn_offsets(self, readings: list[tuple[FusionInput, Any]], now: float) -> None:
+        primary = self.inputs[0]
+        primary_reading = next((reading for fusion_input, reading in readings if fusion_input is primary), None)
+        if primary_reading is None or primary.excluded_for is not None:
+            return
+
+        weight = 1.0
+        if self._learned_at is not None:
+            weight = 1.0 - exp(-(now - self._learned_at) / self.config.offset_time_constant_seconds)
+        self._learned_at = now
+
+        primary_value = primary.read_field(primary_reading)
+        for fusion_input, reading in readings:
+            if fusion_input is primary or fusion_input.excluded_for is not None:
+                continue
+            offset = primary_value - fusion_input.read_field(reading)
+            if fusion_input.offset is None:
+                # sensors are taken to agree when first seen together, up to a fixed offset
+                fusion_input.offset = offset
+            else:
+                fusion_input.offset += weight * (offset - fusion_input.offset)
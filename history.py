@@ -0,0 +1,162 @@
+from array import array
+from bisect import bisect_right
+from collections import deque
+import threading
+from typing import NamedTuple, Optional
+
+"""
+Fixed-memory history of recent values for each measure.
+
+Each measure gets a ring buffer of (monotonic timestamp, value) pairs backed by
+preallocated float64 arrays, so memory use is decided once at startup and stays
+flat no matter how long the process runs.
+"""
+
+
+class WindowSummary(NamedTuple):
+    count: int
+    minimum: float
+    maximum: float
+    mean: float
+    # timestamp of the newest sample in the window
+    until: float
+
+
+class RingBuffer:
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError(f"Ring buffer capacity must be positive, got {capacity}")
+        self.capacity = capacity
+        self._timestamps = array('d', bytes(8 * capacity))
+        self._values = array('d', bytes(8 * capacity))
+        # index the next sample will be written to
+        self._head = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, timestamp: float, value: float) -> None:
+        with self._lock:
+            self._timestamps[self._head] = timestamp
+            self._values[self._head] = value
+            self._head = (self._head + 1) % self.capacity
+            if self._size < self.capacity:
+                self._size += 1
+
+    def latest(self) -> tuple[float, float]:
+        """
+        Returns the most recent (timestamp, value) pair.
+        Raises an `IndexError` if the buffer is empty.
+        """
+        with self._lock:
+            if self._size == 0:
+                raise IndexError("Ring buffer is empty")
+            index = (self._head - 1) % self.capacity
+            return self._timestamps[index], self._values[index]
+
+    def segments(self, since: float = float('-inf')) -> list[tuple[memoryview, memoryview]]:
+        """
+        Returns zero-copy (timestamps, values) views over the samples newer than `since`, oldest first.
+
+        Because the buffer wraps, the samples can span up to two segments.
+        The views alias the live buffer, so they should be consumed before further samples are appended.
+        """
+        with self._lock:
+            timestamps = memoryview(self._timestamps)
+            values = memoryview(self._values)
+            return [(timestamps[lower:upper], values[lower:upper]) for lower, upper in self._bounds(since)]
+
+    def summary(self, since: float = float('-inf')) -> Optional[WindowSummary]:
+        """
+        Summarizes the samples newer than `since`, or returns None if there are none.
+        Unlike `segments`, this reads the buffer under its lock, so appends can't land in the middle of it.
+        """
+        with self._lock:
+            bounds = self._bounds(since)
+            if not bounds:
+                return None
+            segments = [memoryview(self._values)[lower:upper] for lower, upper in bounds]
+            count = sum(len(segment) for segment in segments)
+            return WindowSummary(
+                count,
+                min(min(segment) for segment in segments),
+                max(max(segment) for segment in segments),
+                sum(sum(segment) for segment in segments) / count,
+                self._timestamps[bounds[-1][1] - 1],
+            )
+
+    def _bounds(self, since: float) -> list[tuple[int, int]]:
+        # index ranges of the samples newer than `since`, oldest first; must be called with the lock held
+        start = (self._head - self._size) % self.capacity
+        if start + self._size <= self.capacity:
+            ranges = [(start, start + self._size)]
+        else:
+            ranges = [(start, self.capacity), (0, self._head)]
+
+        bounds = []
+        for lower, upper in ranges:
+            lower = max(lower, bisect_right(self._timestamps, since, lower, upper))
+            if lower < upper:
+                bounds.append((lower, upper))
+        return bounds
+
+    def values(self, since: float = float('-inf')) -> list[float]:
+        """
+        Returns a copy of the values newer than `since`, oldest first.
+        """
+        return [value for _, segment in self.segments(since) for value in segment]
+
+
+# short runs of (monotonic time, value) samples, e.g. the readings since a device last switched
+Samples = deque[tuple[float, float]]
+
+
+def linear_trend(samples: Samples) -> tuple[float, float]:
+    """
+    Least-squares fit of (time, value) samples, returning the fitted value at the newest sample's time
+    and the slope per second. Needs at least two samples at different times.
+    """
+    count = len(samples)
+    mean_time = sum(time for time, _ in samples) / count
+    mean_value = sum(value for _, value in samples) / count
+    spread = sum((time - mean_time) ** 2 for time, _ in samples)
+    slope = sum((time - mean_time) * (value - mean_value) for time, value in samples) / spread
+    return mean_value + slope * (samples[-1][0] - mean_time), slope
+
+
+def rate_of_change(samples: Samples) -> float:
+    """
+    Least-squares slope of (time, value) samples, per second. Needs at least two samples at different times.
+    """
+    return linear_trend(samples)[1]
+
+
+class MeasureHistory:
+    def __init__(self, capacity: int = 8640):
+        self.capacity = capacity
+        self._series: dict[str, RingBuffer] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, capacity: int) -> None:
+        """
+        Sets the capacity of every measure's buffer. Must be called before any samples are recorded.
+        """
+        with self._lock:
+            if self._series:
+                raise RuntimeError("Measure history capacity can't be changed after samples have been recorded")
+            self.capacity = capacity
+
+    def series(self, measure_name: str) -> RingBuffer:
+        buffer = self._series.get(measure_name)
+        if buffer is None:
+            with self._lock:
+                buffer = self._series.setdefault(measure_name, RingBuffer(self.capacity))
+        return buffer
+
+    def measures(self) -> list[str]:
+        return list(self._series)
+
+
+HISTORY = MeasureHistory()
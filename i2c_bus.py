@@ -0,0 +1,149 @@
+from collections import deque
+from dataclasses import dataclass
+import itertools
+import logging
+import threading
+from typing import Any, Optional
+
+import clock
+
+"""
+Process-wide access to the I2C bus.
+
+Every device on the bus (both sensors, and eventually the display) shares a
+single `busio.I2C` handle. Drivers are handed a `BusDevice`, which looks like a
+`busio.I2C` to them but serializes their transactions through a FIFO queue, so
+concurrent readers can't interleave transfers and no device can starve another.
+"""
+
+
+@dataclass
+class BusStats:
+    transactions: int = 0
+    total_hold_seconds: float = 0.0
+    max_hold_seconds: float = 0.0
+    total_wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+    """
+    Number of transactions that held the bus for longer than the bus' `hold_warning_seconds`.
+    """
+    overruns: int = 0
+
+
+class SharedI2CBus:
+    def __init__(self, hold_warning_seconds: float = 0.1):
+        """
+        `hold_warning_seconds` is the longest a single device transaction should hold the bus.
+        It's a warning threshold rather than a limit: a transaction can't be cut short once it's on the wire,
+        so the ones that exceed it are logged and counted in the device's stats after they finish.
+        """
+        self.hold_warning_seconds = hold_warning_seconds
+        self._i2c: Optional[Any] = None
+        self._turn = threading.Condition()
+        self._queue: deque[int] = deque()
+        self._tickets = itertools.count()
+        self._held = False
+        self._holder: Optional[str] = None
+        self._acquired_at = 0.0
+        self._stats: dict[str, BusStats] = {}
+
+    @property
+    def i2c(self) -> Any:
+        with self._turn:
+            if self._i2c is None:
+                # opened on first use so the bus manager can be imported on machines without I2C hardware
+                import board
+                import busio
+
+                self._i2c = busio.I2C(board.SCL, board.SDA)
+            return self._i2c
+
+    def device(self, name: str) -> 'BusDevice':
+        """
+        Returns a bus handle for the named device, to be passed to its driver in place of a `busio.I2C`.
+        """
+        with self._turn:
+            self._stats.setdefault(name, BusStats())
+        return BusDevice(self, name)
+
+    def stats(self) -> dict[str, BusStats]:
+        with self._turn:
+            return {name: BusStats(**vars(stats)) for name, stats in self._stats.items()}
+
+    def acquire(self, name: str) -> None:
+        requested_at = clock.monotonic()
+        with self._turn:
+            ticket = next(self._tickets)
+            self._queue.append(ticket)
+            while self._held or self._queue[0] != ticket:
+                self._turn.wait()
+            self._queue.popleft()
+            self._held = True
+            self._holder = name
+            self._acquired_at = clock.monotonic()
+
+            waited = self._acquired_at - requested_at
+            stats = self._stats[name]
+            stats.total_wait_seconds += waited
+            stats.max_wait_seconds = max(stats.max_wait_seconds, waited)
+
+    def release(self, name: str) -> None:
+        with self._turn:
+            if not self._held or self._holder != name:
+                raise RuntimeError(f"{name} released the I2C bus without holding it")
+            held = clock.monotonic() - self._acquired_at
+            self._held = False
+            self._holder = None
+
+            stats = self._stats[name]
+            stats.transactions += 1
+            stats.total_hold_seconds += held
+            stats.max_hold_seconds = max(stats.max_hold_seconds, held)
+            if held > self.hold_warning_seconds:
+                stats.overruns += 1
+                logging.warning(f"{name} held the I2C bus for {held:.3f}s (warning threshold {self.hold_warning_seconds}s)")
+
+            self._turn.notify_all()
+
+
+class BusDevice:
+    """
+    `busio.I2C`-compatible view of a `SharedI2CBus` for a single device.
+
+    Drivers bracket each transaction with `try_lock()`/`unlock()`.
+    Here `try_lock()` waits for the device's turn in the bus queue rather than failing fast,
+    so it always returns True.
+    """
+    def __init__(self, bus: SharedI2CBus, name: str):
+        self._bus = bus
+        self.name = name
+
+    def try_lock(self) -> bool:
+        self._bus.acquire(self.name)
+        return True
+
+    def unlock(self) -> None:
+        self._bus.release(self.name)
+
+    def scan(self) -> list[int]:
+        return self._bus.i2c.scan()
+
+    def writeto(self, address, buffer, *, start=0, end=None) -> None:
+        self._bus.i2c.writeto(address, buffer, start=start, end=end)
+
+    def readfrom_into(self, address, buffer, *, start=0, end=None) -> None:
+        self._bus.i2c.readfrom_into(address, buffer, start=start, end=end)
+
+    def writeto_then_readfrom(self, address, buffer_out, buffer_in, *, out_start=0, out_end=None, in_start=0, in_end=None) -> None:
+        self._bus.i2c.writeto_then_readfrom(
+            address,
+            buffer_out,
+            buffer_in,
+            out_start=out_start,
+            out_end=out_end,
+            in_start=in_start,
+            in_end=in_end,
+        )
+
+
+SHARED_BUS = SharedI2CBus()
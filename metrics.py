@@ -1,22 +1,288 @@
-from prometheus_client import Gauge
+from typing import Iterator, NamedTuple, Optional
 
-MEASURE_VALUE = Gauge(
-    'measure_value',
-    "Reported value for a measure",
-    ['measure'],
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import REGISTRY, CounterMetricFamily, GaugeMetricFamily, Metric
+from prometheus_client.registry import Collector
+
+from history import HISTORY, MeasureHistory
+from i2c_bus import SHARED_BUS, SharedI2CBus
+
+"""
+Greenhouse metrics are generated at scrape time.
+
+The control loop only records the latest values in an immutable `Snapshot`,
+replacing it wholesale on every update. A scrape reads a single snapshot, so
+every series it exports comes from the same moment, and the control loop never
+hashes label sets or takes metric locks.
+
+Snapshots are only ever replaced from the control loop thread.
+
+Latency histograms and counters are regular client metrics. Their owners bind
+the labelled children once, so recording an observation never looks up labels.
+"""
+
+SENSOR_READ_SECONDS = Histogram(
+    'sensor_read_seconds',
+    "Time taken to get a new reading from a sensor, including waiting for data to be ready",
+    ['sensor'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+)
+SENSOR_READ_FAILURES = Counter(
+    'sensor_read_failures',
+    "Attempts to get a new reading from a sensor that raised an error",
+    ['sensor'],
+)
+SENSOR_READ_TIMEOUTS = Counter(
+    'sensor_read_timeouts',
+    "Readings abandoned because the sensor didn't have data ready within its read timeout",
+    ['sensor'],
+)
+SENSOR_DATA_READY_POLLS = Histogram(
+    'sensor_data_ready_polls',
+    "Number of times a sensor was polled before its reading was ready",
+    ['sensor'],
+    buckets=(0, 1, 2, 4, 8, 16, 32, 64),
+)
+SENSOR_SAMPLING_PERIOD_SECONDS = Gauge(
+    'sensor_sampling_period_seconds',
+    "Current time between readings of a sensor",
+    ['sensor'],
+)
+CONTROL_STATE_SECONDS = Histogram(
+    'control_state_seconds',
+    "Time taken by a controller to read its measure and update its device",
+    ['device'],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+CONTROL_READING_AGE_SECONDS = Histogram(
+    'control_reading_age_seconds',
+    "Age of the sensor reading a controller acted on",
+    ['device'],
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0),
+)
+CONTROL_STALE_READINGS = Counter(
+    'control_stale_readings',
+    "Control decisions skipped because the sensor reading was too old to act on",
+    ['device'],
 )
-DEVICE_ACTIVE = Gauge(
-    'device_active',
-    "Whether a device managing a measure is active",
+SCHEDULER_TICK_SECONDS = Histogram(
+    'scheduler_tick_seconds',
+    "Time taken to run every task released at once",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+SCHEDULER_TASK_SECONDS = Histogram(
+    'scheduler_task_seconds',
+    "Time taken to run a scheduled task",
+    ['task'],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+SCHEDULER_TASK_PERIOD_SECONDS = Gauge(
+    'scheduler_task_period_seconds',
+    "How often a scheduled task is released",
+    ['task'],
+)
+SCHEDULER_MISSED_DEADLINES = Counter(
+    'scheduler_missed_deadlines',
+    "Releases of a scheduled task that finished after their deadline or were skipped",
+    ['task'],
+)
+DEVICE_SWITCHES = Counter(
+    'device_switches',
+    "Number of times a controller has switched its device on or off",
     ['device', 'measure'],
 )
-DEVICE_THRESHOLD = Gauge(
-    'device_threshold',
-    "The measure threshold at which a device activates/deactivates",
-    ['device', 'measure', 'target'],
+PREDICTIVE_OVERRIDES = Counter(
+    'predictive_overrides',
+    "Times the predictive controller departed from plain hysteresis, either holding a device in the state "
+    "hysteresis would have switched it out of ('held') or switching it before hysteresis would have ('early')",
+    ['device', 'measure', 'decision'],
+)
+ACTUATOR_SWITCHES = Counter(
+    'actuator_switches',
+    "Number of times a device's GPIO pin has been switched, including duty cycle pulses",
+    ['device'],
+)
+ACTUATOR_ON_SECONDS = Counter(
+    'actuator_on_seconds',
+    "Time a device's GPIO pin has spent switched on",
+    ['device'],
+)
+ACTUATOR_DUTY_CYCLE = Gauge(
+    'actuator_duty_cycle',
+    "Fraction of each duty cycle window a device is currently driven on for",
+    ['device'],
 )
-DEVICE_ZERO_ENERGY_BAND = Gauge(
-    'device_zero_energy_band',
-    "The amount that a measure must exceed its threshold for a device to activate",
-    ['device', 'measure', 'target'],
+MEASURE_FILTER_REJECTIONS = Counter(
+    'measure_filter_rejections',
+    "Readings of a measure dropped as outliers by its filters",
+    ['measure'],
+)
+FUSION_SOURCE_WEIGHT = Gauge(
+    'fusion_source_weight',
+    "Share of a fused measure's value taken from each sensor",
+    ['measure', 'sensor'],
+)
+FUSION_SOURCE_EXCLUSIONS = Counter(
+    'fusion_source_exclusions',
+    "Times a sensor has been left out of a fused measure, because its last read 'failed', it 'hung' mid-read, or it 'drifted'",
+    ['measure', 'sensor', 'reason'],
+)
+UPDATE_INTERVAL_SECONDS = Gauge(
+    'update_interval_seconds',
+    "Default period of monitors and controllers",
 )
+
+DeviceKey = tuple[str, str]  # device, measure
+ThresholdKey = tuple[str, str, str]  # device, measure, target side
+
+
+class Snapshot(NamedTuple):
+    measures: dict[str, float]
+    # unfiltered values, for the measures that are filtered
+    raw_measures: dict[str, float]
+    devices_active: dict[DeviceKey, bool]
+    thresholds: dict[ThresholdKey, float]
+    zero_energy_bands: dict[ThresholdKey, float]
+
+
+class GreenhouseState:
+    def __init__(self) -> None:
+        self._snapshot = Snapshot({}, {}, {}, {}, {})
+
+    def snapshot(self) -> Snapshot:
+        return self._snapshot
+
+    def set_measure(self, measure: str, value: float, raw_value: Optional[float] = None) -> None:
+        measures, raw_measures, devices_active, thresholds, zero_energy_bands = self._snapshot
+        if raw_value is not None:
+            raw_measures = {**raw_measures, measure: raw_value}
+        self._snapshot = Snapshot({**measures, measure: value}, raw_measures, devices_active, thresholds, zero_energy_bands)
+
+    def set_device_active(self, device: str, measure: str, active: bool) -> None:
+        measures, raw_measures, devices_active, thresholds, zero_energy_bands = self._snapshot
+        self._snapshot = Snapshot(measures, raw_measures, {**devices_active, (device, measure): active}, thresholds, zero_energy_bands)
+
+    def set_threshold(self, device: str, measure: str, target: str, threshold: float, zero_energy_band: float) -> None:
+        measures, raw_measures, devices_active, thresholds, zero_energy_bands = self._snapshot
+        # a device only has one threshold, so drop any series left over from a previous target side
+        thresholds = {key: value for key, value in thresholds.items() if key[:2] != (device, measure)}
+        zero_energy_bands = {key: value for key, value in zero_energy_bands.items() if key[:2] != (device, measure)}
+        thresholds[(device, measure, target)] = threshold
+        zero_energy_bands[(device, measure, target)] = zero_energy_band
+        self._snapshot = Snapshot(measures, raw_measures, devices_active, thresholds, zero_energy_bands)
+
+
+class GreenhouseCollector(Collector):
+    def __init__(self, state: GreenhouseState):
+        self._state = state
+
+    def collect(self) -> Iterator[Metric]:
+        snapshot = self._state.snapshot()
+
+        measure_value = GaugeMetricFamily('measure_value', "Reported value for a measure", labels=['measure'])
+        for measure, value in snapshot.measures.items():
+            measure_value.add_metric([measure], value)
+        yield measure_value
+
+        measure_raw_value = GaugeMetricFamily(
+            'measure_raw_value',
+            "Unfiltered value for a measure, for measures whose readings are filtered before being acted on",
+            labels=['measure'],
+        )
+        for measure, value in snapshot.raw_measures.items():
+            measure_raw_value.add_metric([measure], value)
+        yield measure_raw_value
+
+        device_active = GaugeMetricFamily('device_active', "Whether a device managing a measure is active", labels=['device', 'measure'])
+        for (device, measure), active in snapshot.devices_active.items():
+            device_active.add_metric([device, measure], 1 if active else 0)
+        yield device_active
+
+        device_threshold = GaugeMetricFamily(
+            'device_threshold',
+            "The measure threshold at which a device activates/deactivates",
+            labels=['device', 'measure', 'target'],
+        )
+        for labels, threshold in snapshot.thresholds.items():
+            device_threshold.add_metric(list(labels), threshold)
+        yield device_threshold
+
+        device_zero_energy_band = GaugeMetricFamily(
+            'device_zero_energy_band',
+            "The amount that a measure must exceed its threshold for a device to activate",
+            labels=['device', 'measure', 'target'],
+        )
+        for labels, band in snapshot.zero_energy_bands.items():
+            device_zero_energy_band.add_metric(list(labels), band)
+        yield device_zero_energy_band
+
+
+class MeasureWindowCollector(Collector):
+    """
+    Summarizes every sample recorded in the measure history since the previous scrape.
+
+    Measures are sampled far more often than Prometheus scrapes, so a gauge of the latest value
+    drops most readings, and short spikes with them. Each scrape instead exports the min, max and
+    mean of the samples taken since the last one, along with how many there were.
+
+    Windows are tracked per collector, so with several scrapers each one only sees part of the samples.
+    """
+    def __init__(self, history: MeasureHistory):
+        self._history = history
+        # timestamp of the newest sample already summarized, per measure
+        self._summarized_until: dict[str, float] = {}
+
+    def describe(self) -> Iterator[Metric]:
+        # registering a collector calls `collect()` unless it describes itself, which would swallow a window
+        yield from self._families()
+
+    def collect(self) -> Iterator[Metric]:
+        samples, minimum, maximum, mean = self._families()
+        for measure in self._history.measures():
+            summary = self._history.series(measure).summary(self._summarized_until.get(measure, float('-inf')))
+            if summary is None:
+                samples.add_metric([measure], 0)
+                continue
+            self._summarized_until[measure] = summary.until
+            samples.add_metric([measure], summary.count)
+            minimum.add_metric([measure], summary.minimum)
+            maximum.add_metric([measure], summary.maximum)
+            mean.add_metric([measure], summary.mean)
+        yield from (samples, minimum, maximum, mean)
+
+    def _families(self) -> tuple[GaugeMetricFamily, GaugeMetricFamily, GaugeMetricFamily, GaugeMetricFamily]:
+        return (
+            GaugeMetricFamily('measure_window_samples', "Number of samples of a measure taken since the last scrape", labels=['measure']),
+            GaugeMetricFamily('measure_window_min', "Lowest value of a measure since the last scrape", labels=['measure']),
+            GaugeMetricFamily('measure_window_max', "Highest value of a measure since the last scrape", labels=['measure']),
+            GaugeMetricFamily('measure_window_mean', "Mean value of a measure since the last scrape", labels=['measure']),
+        )
+
+
+class BusCollector(Collector):
+    def __init__(self, bus: SharedI2CBus):
+        self._bus = bus
+
+    def collect(self) -> Iterator[Metric]:
+        stats = self._bus.stats()
+
+        transactions = CounterMetricFamily('i2c_transactions', "I2C transactions made by a device", labels=['device'])
+        hold = CounterMetricFamily('i2c_hold_seconds', "Time a device has spent holding the I2C bus", labels=['device'])
+        wait = CounterMetricFamily('i2c_wait_seconds', "Time a device has spent waiting for its turn on the I2C bus", labels=['device'])
+        overruns = CounterMetricFamily('i2c_overruns', "I2C transactions that held the bus for longer than its warning threshold", labels=['device'])
+        max_hold = GaugeMetricFamily('i2c_max_hold_seconds', "Longest a single transaction of a device has held the I2C bus", labels=['device'])
+        max_wait = GaugeMetricFamily('i2c_max_wait_seconds', "Longest a device has waited for its turn on the I2C bus", labels=['device'])
+        for device, device_stats in stats.items():
+            transactions.add_metric([device], device_stats.transactions)
+            hold.add_metric([device], device_stats.total_hold_seconds)
+            wait.add_metric([device], device_stats.total_wait_seconds)
+            overruns.add_metric([device], device_stats.overruns)
+            max_hold.add_metric([device], device_stats.max_hold_seconds)
+            max_wait.add_metric([device], device_stats.max_wait_seconds)
+        yield from (transactions, hold, wait, overruns, max_hold, max_wait)
+
+
+GREENHOUSE_STATE = GreenhouseState()
+REGISTRY.register(GreenhouseCollector(GREENHOUSE_STATE))
+REGISTRY.register(BusCollector(SHARED_BUS))
+REGISTRY.register(MeasureWindowCollector(HISTORY))
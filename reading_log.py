@@ -0,0 +1,156 @@
+import mmap
+import os
+import struct
+import threading
+from typing import Iterator, NamedTuple, Optional
+
+import clock
+
+"""
+Append-only on-disk log of measure readings and device actuations.
+
+Records are fixed-size and written into a memory-mapped, preallocated segment
+file. Writes only touch the page cache; the segment is flushed to disk every
+`flush_interval_seconds` (and on rotation/close) rather than on every tick, so
+the SD card isn't written to on every sample. When a segment fills up it's
+rotated to `<path>.1`, `<path>.2`, ... and the oldest segments are dropped.
+"""
+
+# timestamp, value, record kind, name (null-padded)
+RECORD = struct.Struct('<ddB23s')
+MEASURE_RECORD = 0
+DEVICE_RECORD = 1
+
+
+class LogRecord(NamedTuple):
+    timestamp: float
+    kind: int
+    name: str
+    value: float
+
+
+class ReadingLog:
+    """
+    Log that silently discards records until `open()` is called.
+    """
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._offset = 0
+        self._last_flush = 0.0
+        self._names: dict[str, bytes] = {}
+
+    @property
+    def is_open(self) -> bool:
+        return self._mmap is not None
+
+    def open(self, path: str, segment_bytes: int, segments_kept: int, flush_interval_seconds: float) -> None:
+        if segment_bytes < RECORD.size:
+            raise ValueError(f"Log segments must be at least {RECORD.size} bytes")
+        with self._lock:
+            self.path = path
+            self.segment_bytes = segment_bytes - segment_bytes % RECORD.size
+            self.segments_kept = segments_kept
+            self.flush_interval_seconds = flush_interval_seconds
+            self._open_segment()
+
+    def append(self, kind: int, name: str, value: float, timestamp: Optional[float] = None) -> None:
+        if self._mmap is None:
+            return
+
+        encoded_name = self._names.get(name)
+        if encoded_name is None:
+            encoded_name = self._names.setdefault(name, name.encode()[:23])
+
+        with self._lock:
+            if self._mmap is None:
+                return
+            if self._offset + RECORD.size > self.segment_bytes:
+                self._rotate()
+            RECORD.pack_into(self._mmap, self._offset, clock.time() if timestamp is None else timestamp, value, kind, encoded_name)
+            self._offset += RECORD.size
+
+            if clock.monotonic() - self._last_flush >= self.flush_interval_seconds:
+                self._flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._mmap is not None:
+                self._flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_segment()
+
+    def _flush(self) -> None:
+        self._mmap.flush()
+        self._last_flush = clock.monotonic()
+
+    def _open_segment(self) -> None:
+        if not os.path.exists(self.path) or os.path.getsize(self.path) != self.segment_bytes:
+            if os.path.exists(self.path):
+                # segment size changed since the last run; keep the old segment rather than reinterpreting it
+                self._shift_segments()
+            with open(self.path, 'wb') as segment:
+                segment.truncate(self.segment_bytes)
+
+        self._file = open(self.path, 'r+b')
+        self._mmap = mmap.mmap(self._file.fileno(), self.segment_bytes)
+        self._offset = _end_of_records(self._mmap) * RECORD.size
+        self._last_flush = clock.monotonic()
+
+    def _close_segment(self) -> None:
+        if self._mmap is not None:
+            self._mmap.flush()
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _rotate(self) -> None:
+        self._close_segment()
+        self._shift_segments()
+        self._open_segment()
+
+    def _shift_segments(self) -> None:
+        oldest = f"{self.path}.{self.segments_kept}"
+        if os.path.exists(oldest):
+            os.remove(oldest)
+        for index in range(self.segments_kept - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"):
+                os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        if self.segments_kept > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+
+def _end_of_records(buffer) -> int:
+    """
+    Returns the index of the first unwritten record in a segment.
+    Unwritten space is zeroed and records are written in order, so we can binary search for the boundary.
+    """
+    low, high = 0, len(buffer) // RECORD.size
+    while low < high:
+        middle = (low + high) // 2
+        if RECORD.unpack_from(buffer, middle * RECORD.size)[0] == 0.0:
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+
+def read_records(path: str) -> Iterator[LogRecord]:
+    """
+    Yields every record in a single segment file, oldest first.
+    """
+    with open(path, 'rb') as segment:
+        data = segment.read()
+    for index in range(_end_of_records(data)):
+        timestamp, value, kind, name = RECORD.unpack_from(data, index * RECORD.size)
+        yield LogRecord(timestamp, kind, name.rstrip(b'\0').decode(), value)
+
+
+READING_LOG = ReadingLog()
@@ -0,0 +1,210 @@
+from dataclasses import dataclass
+import heapq
+import itertools
+import logging
+import math
+import threading
+from typing import Any, Callable, Optional
+
+import clock
+from clock import VirtualClock
+from metrics import SCHEDULER_MISSED_DEADLINES, SCHEDULER_TASK_PERIOD_SECONDS, SCHEDULER_TASK_SECONDS, SCHEDULER_TICK_SECONDS
+from sensor import Sensor
+
+"""
+Multi-rate scheduler for monitors and controllers.
+
+Each task declares its own period and deadline. Releases are anchored to the
+monotonic clock (the next release is always `previous release + period`), so
+time spent doing work never causes the schedule to drift.
+
+Tasks can also be triggered by a sensor: they're released as soon as that
+sensor publishes a new reading, and only fall back to their periodic release
+if the sensor goes quiet for longer than a period.
+"""
+
+
+@dataclass
+class ScheduledTask:
+    release_at: float
+    name: str
+    action: Callable[[], None]
+    period_seconds: float
+
+    """
+    How long after its release the task must have finished running.
+    """
+    deadline_seconds: float
+
+    """
+    Order in which the task was added, used to run tasks released at the same time in the order they were added.
+    """
+    sequence: int
+    trigger: Optional[Sensor[Any]] = None
+    triggered: bool = False
+    missed_deadlines: int = 0
+
+    def __post_init__(self):
+        self._run_seconds = SCHEDULER_TASK_SECONDS.labels(task=self.name)
+        self._missed_deadlines = SCHEDULER_MISSED_DEADLINES.labels(task=self.name)
+        SCHEDULER_TASK_PERIOD_SECONDS.labels(task=self.name).set(self.period_seconds)
+
+    def record_run(self, seconds: float) -> None:
+        self._run_seconds.observe(seconds)
+
+    def miss_deadlines(self, count: int = 1) -> None:
+        self.missed_deadlines += count
+        self._missed_deadlines.inc(count)
+
+
+class Scheduler:
+    def __init__(self) -> None:
+        # heap of (release time, sequence, task); plain tuples compare much faster than dataclass instances
+        self._queue: list[tuple[float, int, ScheduledTask]] = []
+        self._wakeup = threading.Condition()
+        self._sequence = itertools.count()
+        self._triggered: list[ScheduledTask] = []
+
+    def add(
+        self,
+        name: str,
+        action: Callable[[], None],
+        period_seconds: float,
+        deadline_seconds: Optional[float] = None,
+        trigger: Optional[Sensor[Any]] = None,
+    ) -> ScheduledTask:
+        """
+        Schedules `action` to run every `period_seconds`, starting immediately.
+        `deadline_seconds` defaults to the period.
+
+        If `trigger` is set, the task instead runs whenever that sensor publishes a new reading.
+        It falls back to a periodic release if no reading arrives within its period plus deadline.
+        """
+        deadline_seconds = period_seconds if deadline_seconds is None else deadline_seconds
+        release_at = clock.monotonic()
+        if trigger is not None:
+            # triggered tasks wait for their first reading rather than running immediately
+            release_at += period_seconds + deadline_seconds
+        task = ScheduledTask(
+            release_at=release_at,
+            name=name,
+            action=action,
+            period_seconds=period_seconds,
+            deadline_seconds=deadline_seconds,
+            sequence=next(self._sequence),
+            trigger=trigger,
+        )
+        if trigger is not None:
+            trigger.subscribe(lambda: self._trigger(task))
+
+        with self._wakeup:
+            heapq.heappush(self._queue, (task.release_at, task.sequence, task))
+            self._wakeup.notify()
+
+        return task
+
+    def _trigger(self, task: ScheduledTask) -> None:
+        with self._wakeup:
+            self._triggered.append(task)
+            self._wakeup.notify()
+
+    def run_pending(self) -> None:
+        """
+        Runs every task whose release time has passed or whose trigger has fired.
+        """
+        started_at = clock.monotonic()
+        ran = False
+        while True:
+            with self._wakeup:
+                self._release_triggered()
+                if not self._queue or self._queue[0][0] > clock.monotonic():
+                    if ran:
+                        SCHEDULER_TICK_SECONDS.observe(clock.monotonic() - started_at)
+                    return
+                _, _, task = heapq.heappop(self._queue)
+                released_at = task.release_at
+                was_triggered = task.triggered
+                task.triggered = False
+
+            next_release = self._run(task, released_at, was_triggered)
+            ran = True
+
+            with self._wakeup:
+                # a trigger that fired while the task was running has already set its next release
+                if not task.triggered:
+                    task.release_at = next_release
+                heapq.heappush(self._queue, (task.release_at, task.sequence, task))
+
+    def next_release(self) -> Optional[float]:
+        """
+        Monotonic time of the earliest pending release, or None if nothing is scheduled.
+        """
+        with self._wakeup:
+            if self._triggered:
+                return clock.monotonic()
+            return self._queue[0][0] if self._queue else None
+
+    def _release_triggered(self) -> None:
+        if not self._triggered:
+            return
+        now = clock.monotonic()
+        for task in self._triggered:
+            task.release_at = now
+            task.triggered = True
+        self._queue = [(task.release_at, task.sequence, task) for _, _, task in self._queue]
+        heapq.heapify(self._queue)
+        self._triggered.clear()
+
+    def _run(self, task: ScheduledTask, released_at: float, was_triggered: bool) -> float:
+        """
+        Runs a released task, records any missed deadlines and returns its next release time.
+        """
+        started_at = clock.monotonic()
+        try:
+            task.action()
+        except Exception:
+            logging.exception(f"Scheduled task {task.name} failed")
+        finished_at = clock.monotonic()
+        task.record_run(finished_at - started_at)
+
+        if finished_at > released_at + task.deadline_seconds:
+            task.miss_deadlines()
+            logging.warning(f"{task.name} missed its deadline by {finished_at - released_at - task.deadline_seconds:.3f}s")
+
+        next_release = released_at + task.period_seconds
+        if task.trigger is not None:
+            if not was_triggered:
+                task.miss_deadlines()
+                logging.warning(f"{task.name} ran without a new reading from its trigger")
+            # give the trigger until the deadline to fire before falling back to a periodic release
+            next_release += task.deadline_seconds
+        elif next_release < finished_at:
+            # skip releases we've already fallen behind on instead of running them back-to-back
+            skipped = math.ceil((finished_at - next_release) / task.period_seconds)
+            task.miss_deadlines(skipped)
+            logging.warning(f"{task.name} skipped {skipped} release(s)")
+            next_release += skipped * task.period_seconds
+        return next_release
+
+    def run_forever(self) -> None:
+        while True:
+            self.run_pending()
+            with self._wakeup:
+                if self._triggered:
+                    continue
+                timeout = self._queue[0][0] - clock.monotonic() if self._queue else None
+                if timeout is None or timeout > 0:
+                    self._wakeup.wait(timeout)
+
+    def run_virtual(self, virtual_clock: VirtualClock, until: float) -> None:
+        """
+        Runs the schedule against a virtual clock, jumping straight to each release instead of waiting for it,
+        until the clock reaches `until`. Everything runs on the calling thread.
+        """
+        while True:
+            self.run_pending()
+            next_release = self.next_release()
+            if next_release is None or next_release > until:
+                virtual_clock.advance_to(until)
+                return
+            virtual_clock.advance_to(next_release)
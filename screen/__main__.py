@@ -0,0 +1,27 @@
+"""
+Renders a sample HUD to the console:
+
+    python -m screen
+"""
+from screen.greenhouse_hud import Hud, HudState, MetricState
+from screen.screen import AddressableTextScreen
+
+test = AddressableTextScreen(128, 64)
+test.set(0, 63, True)
+test.set(127, 0, True)
+test.set(127, 63, True)
+hud = Hud(HudState(
+    co2=MetricState(
+        current=600,
+        target=800,
+        controller_running=False,
+    ),
+    humidity=MetricState(
+        current=84.65,
+        target=95.00,
+        controller_running=True,
+    ),
+    temp=71.2,
+))
+hud.render(test)
+test.print()
@@ -3,8 +3,10 @@
 https://www.fontspace.com/teeny-tiny-pixls-font-f30095
 Credit to Chequered Ink
 """
-from dataclasses import dataclass, field
-from screen_types import Composition, Renderable
+from dataclasses import dataclass
+from functools import lru_cache
+
+from screen.screen_types import ColumnBitmap, Composition, DrawBitmap, Renderable
 
 TEXT_MAPPING = {
     "1": "110010010010111",
@@ -52,6 +54,42 @@ TEXT_MAPPING = {
 }
 
 
+GLYPH_WIDTH = 3
+GLYPH_HEIGHT = 5
+GLYPH_MASK = (1 << GLYPH_HEIGHT) - 1
+
+
+def glyph_columns(encoded: str) -> tuple[int, ...]:
+    """
+    Converts a row-major glyph string into per-column bitmasks, top row in the least significant bit.
+    """
+    return tuple(
+        sum(1 << yi for yi in range(GLYPH_HEIGHT) if encoded[yi * GLYPH_WIDTH + xi] == "1")
+        for xi in range(GLYPH_WIDTH)
+    )
+
+
+GLYPH_COLUMNS = {char: glyph_columns(encoded) for char, encoded in TEXT_MAPPING.items()}
+
+
+@lru_cache(maxsize=512)
+def text_bitmap(text: str, on: bool) -> ColumnBitmap:
+    """
+    Rasterizes a run of text into a bitmap, cached by text and polarity.
+    Characters are 3px wide with a 1px gap between them, which is left untouched when drawn.
+    """
+    bits: list[int] = []
+    masks: list[int] = []
+    for index, char in enumerate(text):
+        if index:
+            bits.append(0)
+            masks.append(0)
+        for column in GLYPH_COLUMNS[char]:
+            bits.append(column if on else ~column & GLYPH_MASK)
+            masks.append(GLYPH_MASK)
+    return ColumnBitmap(tuple(bits), tuple(masks))
+
+
 @dataclass
 class Character(Renderable):
     char: str
@@ -60,11 +98,10 @@ class Character(Renderable):
     on: bool
 
     def render(self, screen):
-        text = TEXT_MAPPING[self.char]
-        for yi, y in enumerate(range(self.y, self.y + 5)):
-            for xi, x in enumerate(range(self.x, self.x + 3)):
-                index = yi * 3 + xi
-                screen.set(x, y, text[index] == ("1" if self.on else "0"))
+        screen.draw_bitmap(self.x, self.y, text_bitmap(self.char, self.on))
+
+    def compile(self):
+        return [DrawBitmap(self.x, self.y, text_bitmap(self.char, self.on))]
 
 
 @dataclass
@@ -72,11 +109,11 @@ class Text(Composition):
     text: str
     x: int
     y: int
-    characters: list[Character] = field(init=False)
     on: bool
 
-    def __post_init__(self):
-        self.characters = [
+    @property
+    def characters(self) -> list[Character]:
+        return [
             Character(char, self.x + i * 4, self.y, self.on)
             for i, char
             in enumerate(self.text)
@@ -84,3 +121,7 @@ class Text(Composition):
 
     def components(self):
         return self.characters
+
+    def compile(self):
+        # draw the whole run from the cache rather than each character separately
+        return [DrawBitmap(self.x, self.y, text_bitmap(self.text, self.on))]
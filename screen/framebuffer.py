@@ -0,0 +1,161 @@
+from dataclasses import dataclass
+import re
+from typing import Optional, Sequence
+
+from screen.screen_types import AddressableBWScreen
+
+ON = "■"
+OFF = " "
+
+
+@dataclass(frozen=True)
+class DirtyRegion:
+    """
+    Run of changed bytes within one page: columns `x_start` up to (but not including) `x_end`.
+    """
+    page: int
+    x_start: int
+    x_end: int
+
+
+class PackedFramebuffer(AddressableBWScreen):
+    """
+    Black and white framebuffer packed eight pixels to a byte, in the page layout used by SSD1306-style displays.
+
+    The screen is split into horizontal pages eight pixels tall. Byte `page * width + x` holds the column of
+    pixels at `x` in that page, with the least significant bit at the top. Bulk operations work on whole
+    runs of bytes at once instead of pixel by pixel.
+    """
+    def __init__(self, width: int, height: int):
+        if height % 8:
+            raise ValueError(f"Framebuffer height must be a multiple of 8, got {height}")
+        self.width = width
+        self.height = height
+        self.pages = height // 8
+        self.buffer = bytearray(width * self.pages)
+        self._blank = bytes(len(self.buffer))
+        # copy of what the display currently shows, or None if unknown (e.g. before the first frame)
+        self._shown: Optional[bytearray] = None
+
+    def set(self, x, y, on):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            raise IndexError(f"Pixel ({x}, {y}) is outside of the {self.width}x{self.height} screen")
+        index = (y >> 3) * self.width + x
+        if on:
+            self.buffer[index] |= 1 << (y & 7)
+        else:
+            self.buffer[index] &= ~(1 << (y & 7)) & 0xFF
+
+    def get(self, x: int, y: int) -> bool:
+        return bool(self.buffer[(y >> 3) * self.width + x] >> (y & 7) & 1)
+
+    def clear(self):
+        self.buffer[:] = self._blank
+
+    def fill_span(self, x: int, y: int, width: int, on: bool) -> None:
+        """
+        Turns a horizontal run of pixels on or off.
+        """
+        self.fill_rect(x, y, width, 1, on)
+
+    def fill_rect(self, x, y, width, height, on):
+        # clip to the screen
+        x_start, x_end = max(x, 0), min(x + width, self.width)
+        y_start, y_end = max(y, 0), min(y + height, self.height)
+        if x_start >= x_end or y_start >= y_end:
+            return
+
+        run = x_end - x_start
+        for page in range(y_start >> 3, ((y_end - 1) >> 3) + 1):
+            top = max(y_start - page * 8, 0)
+            bottom = min(y_end - page * 8, 8)
+            mask = ((1 << bottom) - 1) & ~((1 << top) - 1)
+            start = page * self.width + x_start
+            self._apply_mask(start, run, mask, on)
+
+    def draw_bitmap(self, x, y, bitmap):
+        if x < 0 or x + bitmap.width > self.width:
+            # clipped bitmaps are rare enough to take the per-pixel path
+            for xi, (bits, mask) in enumerate(zip(bitmap.bits, bitmap.masks)):
+                for yi in range(mask.bit_length()):
+                    if mask >> yi & 1 and 0 <= x + xi < self.width and 0 <= y + yi < self.height:
+                        self.set(x + xi, y + yi, bool(bits >> yi & 1))
+            return
+
+        page = y >> 3
+        for bits, mask in bitmap.planes(y & 7):
+            if 0 <= page < self.pages and mask:
+                start = page * self.width + x
+                end = start + bitmap.width
+                segment = int.from_bytes(self.buffer[start:end], 'little')
+                # bits outside the mask are left alone, like on the per-pixel path
+                self.buffer[start:end] = (segment & ~mask | bits & mask).to_bytes(bitmap.width, 'little')
+            page += 1
+
+    def _apply_mask(self, start: int, run: int, mask: int, on: bool) -> None:
+        """
+        Sets or clears the bits in `mask` across `run` consecutive bytes, using a single big-integer operation
+        rather than a Python-level loop over each byte.
+        """
+        segment = int.from_bytes(self.buffer[start:start + run], 'little')
+        repeated = int.from_bytes(bytes((mask,)) * run, 'little')
+        if on:
+            segment |= repeated
+        else:
+            segment &= ~repeated
+        self.buffer[start:start + run] = segment.to_bytes(run, 'little')
+
+    def dirty_regions(self, merge_gap: int = 8) -> list[DirtyRegion]:
+        """
+        Returns the runs of bytes that differ from what was last marked as shown, so only those need to be sent to the panel.
+
+        Changed runs in the same page separated by fewer than `merge_gap` unchanged bytes are merged,
+        since addressing a new run costs more than resending a few unchanged bytes.
+        """
+        if self._shown is None:
+            return [DirtyRegion(page, 0, self.width) for page in range(self.pages)]
+
+        # runs of nonzero bytes in the XOR of the two frames, allowing short gaps of unchanged bytes inside a run
+        changed = re.compile(rb'[^\x00]+(?:\x00{1,%d}[^\x00]+)*' % (merge_gap - 1) if merge_gap > 1 else rb'[^\x00]+')
+        regions = []
+        for page in range(self.pages):
+            start = page * self.width
+            end = start + self.width
+            if self.buffer[start:end] == self._shown[start:end]:
+                continue
+            difference = int.from_bytes(self.buffer[start:end], 'little') ^ int.from_bytes(self._shown[start:end], 'little')
+            for run in changed.finditer(difference.to_bytes(self.width, 'little')):
+                regions.append(DirtyRegion(page, run.start(), run.end()))
+        return regions
+
+    def region_bytes(self, region: DirtyRegion) -> memoryview:
+        start = region.page * self.width
+        return memoryview(self.buffer)[start + region.x_start:start + region.x_end]
+
+    def mark_shown(self, regions: Optional[Sequence[DirtyRegion]] = None) -> None:
+        """
+        Records that the given regions (or the whole buffer) have been sent to the display.
+        While the display contents are unknown, `dirty_regions()` covers the whole screen, so the whole buffer is recorded.
+        """
+        if self._shown is None or regions is None:
+            self._shown = bytearray(self.buffer)
+            return
+        for region in regions:
+            start = region.page * self.width
+            self._shown[start + region.x_start:start + region.x_end] = self.region_bytes(region)
+
+    def invalidate(self) -> None:
+        """
+        Forgets what the display shows, so the next `dirty_regions()` covers the whole screen.
+        """
+        self._shown = None
+
+    def rows(self) -> Sequence[str]:
+        return [
+            "".join(ON if self.get(x, y) else OFF for x in range(self.width))
+            for y in range(self.height)
+        ]
+
+    def print(self):
+        for row in self.rows():
+            print(row)
@@ -38,14 +38,14 @@ CO2 bar (max 1200, curr 800, target 1000)
 *.*.
 
 """
+from collections import OrderedDict
 from dataclasses import dataclass
 from math import floor
 from typing import Literal
 
-from font import Text
-from screen import AddressableTextScreen
-from screen_types import Composition
-from shapes import Rectangle
+from screen.font import Text
+from screen.screen_types import Composition, DrawOp
+from screen.shapes import Rectangle
 
 
 @dataclass
@@ -97,15 +97,27 @@ class Bar(Composition):
     def x_pos(self, value):
         return floor(((value - self.min_raw) / self.size_raw) * self.width)
 
+    def positions(self) -> tuple[int, int, int]:
+        """
+        Returns the boundary, reading and target x positions, working out the bar's range only once.
+        """
+        min_raw = self.min_raw
+        size_raw = self.max_raw - min_raw
+        return tuple(
+            floor(((value - min_raw) / size_raw) * self.width)
+            for value in (self.boundary, self.reading, self.target)
+        )
+
     def components(self):
-        reading_rect_min = min(self.boundary_x, self.reading_x)
-        reading_rect_max = max(self.boundary_x, self.reading_x)
+        boundary_x, reading_x, target_x = self.positions()
+        reading_rect_min = min(boundary_x, reading_x)
+        reading_rect_max = max(boundary_x, reading_x)
         reading_rect_width = reading_rect_max - reading_rect_min
 
         # high goes from boundary to the closer of the reading and the target
-        high_reading_rect_edge = min(self.reading_x, self.target_x) if self.target_direction == 'up' else max(self.reading_x, self.target_x)
-        high_reading_rect_min = min(self.boundary_x, high_reading_rect_edge)
-        high_reading_rect_max = max(self.boundary_x, high_reading_rect_edge)
+        high_reading_rect_edge = min(reading_x, target_x) if self.target_direction == 'up' else max(reading_x, target_x)
+        high_reading_rect_min = min(boundary_x, high_reading_rect_edge)
+        high_reading_rect_max = max(boundary_x, high_reading_rect_edge)
         high_reading_rect_width = high_reading_rect_max - high_reading_rect_min
 
         return [
@@ -114,7 +126,7 @@ class Bar(Composition):
             # Reading rect (middle portion)
             Rectangle(self.x + high_reading_rect_min, self.y + 2, high_reading_rect_width, 3, True),
             # Target marker
-            Rectangle(self.x + self.target_x, self.y, 1, 5, True),
+            Rectangle(self.x + target_x, self.y, 1, 5, True),
         ]
 
 
@@ -147,38 +159,67 @@ class HudState:
     temp: float
 
 
+# compiled draw ops for recently displayed HUDs, keyed by `Hud.display_key()`
+COMPILED_HUDS: OrderedDict[tuple, list[DrawOp]] = OrderedDict()
+COMPILED_HUDS_SIZE = 64
+
+
 @dataclass
 class Hud(Composition):
     state: HudState
 
+    def texts(self) -> tuple[str, str, str]:
+        return (
+            f"HUM    {self.state.humidity.current:.1f}% / {self.state.humidity.target:.1f}%",
+            f"CO2    {self.state.co2.current:.0f} PPM / {self.state.co2.target:.0f} PPM",
+            f"TEMP {self.state.temp:.1f}°F",
+        )
+
+    def bars(self) -> tuple[Bar, Bar]:
+        return (
+            Bar('down', self.state.co2.target, self.state.co2.current, 1200, 9, 20, 118),
+            Bar('up', self.state.humidity.target, self.state.humidity.current, 40.0, 9, 30, 118),
+        )
+
+    def display_key(self) -> tuple:
+        """
+        Everything that affects what the HUD looks like: readouts as they're formatted, toggle states and bar pixel positions.
+        States that would display identically share a key, even if their raw values differ.
+        """
+        co2_bar, humidity_bar = self.bars()
+        return (
+            self.texts(),
+            self.state.co2.controller_running,
+            self.state.humidity.controller_running,
+            co2_bar.positions(),
+            humidity_bar.positions(),
+        )
+
     def components(self):
+        humidity_text, co2_text, temp_text = self.texts()
+        co2_bar, humidity_bar = self.bars()
         return [
-            Text(f"HUM    {self.state.humidity.current:.1f}% / {self.state.humidity.target:.1f}%", 0, 0, True),
-            Text(f"CO2    {self.state.co2.current:.0f} PPM / {self.state.co2.target:.0f} PPM", 0, 6, True),
-            Text(f"TEMP {self.state.temp:.1f}°F", 0, 12, True),
+            Text(humidity_text, 0, 0, True),
+            Text(co2_text, 0, 6, True),
+            Text(temp_text, 0, 12, True),
             Toggle(0, 18, self.state.co2.controller_running, "C"),
-            Bar('down', self.state.co2.target, self.state.co2.current, 1200, 9, 20, 118),
+            co2_bar,
             Toggle(0, 28, self.state.humidity.controller_running, "H"),
-            Bar('up', self.state.humidity.target, self.state.humidity.current, 40.0, 9, 30, 118),
+            humidity_bar,
         ]
 
-
-test = AddressableTextScreen(128, 64)
-test.set(0, 63, True)
-test.set(127, 0, True)
-test.set(127, 63, True)
-hud = Hud(HudState(
-    co2=MetricState(
-        current=600,
-        target=800,
-        controller_running=False,
-    ),
-    humidity=MetricState(
-        current=84.65,
-        target=95.00,
-        controller_running=True,
-    ),
-    temp=71.2,
-))
-hud.render(test)
-test.print()
+    def compile(self):
+        """
+        Returns the HUD's draw ops, reusing the compiled ops of a previous HUD that displayed the same thing.
+        An unchanged display returns the very same list, so callers can skip redrawing with an identity check.
+        """
+        key = self.display_key()
+        ops = COMPILED_HUDS.get(key)
+        if ops is None:
+            ops = super().compile()
+            COMPILED_HUDS[key] = ops
+            if len(COMPILED_HUDS) > COMPILED_HUDS_SIZE:
+                COMPILED_HUDS.popitem(last=False)
+        else:
+            COMPILED_HUDS.move_to_end(key)
+        return ops
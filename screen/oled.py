@@ -0,0 +1,151 @@
+from typing import Optional, Protocol
+
+from screen.framebuffer import PackedFramebuffer
+
+"""
+SSD1306-style monochrome OLED driven over I2C.
+
+The display's RAM uses the same page layout as `PackedFramebuffer`, so each
+changed region of the framebuffer is sent as-is in a single bulk data write,
+preceded by the commands that address that region.
+"""
+
+COMMAND = 0x00
+DATA = 0x40
+
+SET_COLUMN_ADDRESS = 0x21
+SET_PAGE_ADDRESS = 0x22
+
+
+class I2CBus(Protocol):
+    """
+    The subset of `busio.I2C` the display needs.
+    """
+    def try_lock(self) -> bool: ...
+
+    def unlock(self) -> None: ...
+
+    def writeto(self, address: int, buffer, *, start: int = 0, end: Optional[int] = None) -> None: ...
+
+
+def initialization_commands(height: int) -> bytes:
+    return bytes([
+        0xAE,  # display off
+        0xD5, 0x80,  # clock divide ratio / oscillator frequency
+        0xA8, height - 1,  # multiplex ratio
+        0xD3, 0x00,  # display offset
+        0x40,  # start line 0
+        0x8D, 0x14,  # enable charge pump
+        0x20, 0x00,  # horizontal addressing mode
+        0xA1,  # map column 127 to SEG0
+        0xC8,  # scan COM outputs in reverse
+        0xDA, 0x12 if height == 64 else 0x02,  # COM pin configuration
+        0x81, 0xCF,  # contrast
+        0xD9, 0xF1,  # pre-charge period
+        0xDB, 0x40,  # VCOMH deselect level
+        0xA4,  # display RAM contents
+        0xA6,  # non-inverted
+        0xAF,  # display on
+    ])
+
+
+class SSD1306Display(PackedFramebuffer):
+    def __init__(self, i2c: I2CBus, address: int = 0x3C, width: int = 128, height: int = 64):
+        super().__init__(width, height)
+        self._i2c = i2c
+        self.address = address
+        # control byte followed by at most a full page of data, reused for every write
+        self._transfer = bytearray(width + 1)
+
+    def initialize(self) -> None:
+        self._command(initialization_commands(self.height))
+        self.invalidate()
+
+    def show(self) -> int:
+        """
+        Sends the regions that changed since the last call to the display, and returns how many data bytes were sent.
+        """
+        regions = self.dirty_regions()
+        sent = 0
+        for region in regions:
+            self._command(bytes([
+                SET_COLUMN_ADDRESS, region.x_start, region.x_end - 1,
+                SET_PAGE_ADDRESS, region.page, region.page,
+            ]))
+            length = region.x_end - region.x_start
+            self._transfer[0] = DATA
+            self._transfer[1:length + 1] = self.region_bytes(region)
+            self._write(self._transfer, length + 1)
+            sent += length
+        self.mark_shown(regions)
+        return sent
+
+    def _command(self, commands: bytes) -> None:
+        self._write(bytes([COMMAND]) + commands, len(commands) + 1)
+
+    def _write(self, buffer, end: int) -> None:
+        # the shared bus queues us behind other devices here, rather than failing
+        while not self._i2c.try_lock():
+            pass
+        try:
+            self._i2c.writeto(self.address, buffer, end=end)
+        finally:
+            self._i2c.unlock()
+
+
+class SimulatedPanel(I2CBus):
+    """
+    Stand-in for an SSD1306 on the bus, for testing without hardware.
+
+    It interprets addressing commands and data writes into its own copy of display RAM,
+    and counts the bytes and transactions it receives.
+    """
+    def __init__(self, width: int = 128, height: int = 64):
+        self.width = width
+        self.pages = height // 8
+        self.ram = bytearray(width * self.pages)
+        self.transactions = 0
+        self.bytes_written = 0
+        self._columns = (0, width - 1)
+        self._page_range = (0, self.pages - 1)
+        self._column = 0
+        self._page = 0
+
+    def try_lock(self) -> bool:
+        return True
+
+    def unlock(self) -> None:
+        pass
+
+    def writeto(self, address, buffer, *, start=0, end=None):
+        payload = bytes(buffer[start:end])
+        self.transactions += 1
+        self.bytes_written += len(payload)
+        if payload[0] == DATA:
+            for byte in payload[1:]:
+                self._write_data(byte)
+            return
+
+        commands = payload[1:]
+        index = 0
+        while index < len(commands):
+            command = commands[index]
+            if command == SET_COLUMN_ADDRESS:
+                self._columns = (commands[index + 1], commands[index + 2])
+                self._column = self._columns[0]
+                index += 3
+            elif command == SET_PAGE_ADDRESS:
+                self._page_range = (commands[index + 1], commands[index + 2])
+                self._page = self._page_range[0]
+                index += 3
+            else:
+                index += 1
+
+    def _write_data(self, byte: int) -> None:
+        self.ram[self._page * self.width + self._column] = byte
+        # horizontal addressing mode: advance through the column window, wrapping onto the next page
+        if self._column < self._columns[1]:
+            self._column += 1
+            return
+        self._column = self._columns[0]
+        self._page = self._page + 1 if self._page < self._page_range[1] else self._page_range[0]
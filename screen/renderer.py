@@ -0,0 +1,71 @@
+import logging
+import threading
+import time
+from typing import Optional
+
+from screen.greenhouse_hud import Hud, HudState
+from screen.oled import SSD1306Display
+
+
+class HudRenderer(threading.Thread):
+    """
+    Draws the HUD on its own thread, so display I/O never adds latency to the control loop.
+
+    The control loop hands over `HudState` snapshots with `submit()`, which only stores the latest one.
+    The renderer draws at most `max_fps` frames per second, skips frames whose HUD wouldn't change,
+    and only sends the changed parts of each frame to the display.
+    Submitted states must not be mutated afterwards.
+    """
+    def __init__(self, display: SSD1306Display, max_fps: float = 2.0):
+        super().__init__(name="hud-renderer", daemon=True)
+        self.display = display
+        self.frame_interval = 1.0 / max_fps
+        self.frames_drawn = 0
+        self._state: Optional[HudState] = None
+        self._lock = threading.Lock()
+        self._submitted = threading.Event()
+        self._stopped = threading.Event()
+
+    def submit(self, state: HudState) -> None:
+        with self._lock:
+            self._state = state
+        self._submitted.set()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._submitted.set()
+
+    def run(self) -> None:
+        try:
+            self.display.initialize()
+        except OSError:
+            logging.exception("Failed to initialize the display")
+            return
+
+        drawn_ops = None
+        next_frame = time.monotonic()
+        while not self._stopped.is_set():
+            self._submitted.wait()
+            # cap the frame rate; states submitted in the meantime replace each other
+            self._stopped.wait(max(0.0, next_frame - time.monotonic()))
+            with self._lock:
+                state = self._state
+                self._submitted.clear()
+            if state is None or self._stopped.is_set():
+                continue
+
+            next_frame = time.monotonic() + self.frame_interval
+            ops = Hud(state).compile()
+            if ops is drawn_ops:
+                continue
+            try:
+                self.display.clear()
+                for op in ops:
+                    op.draw(self.display)
+                self.display.show()
+            except OSError:
+                logging.exception("Failed to update the display")
+                self.display.invalidate()
+                continue
+            drawn_ops = ops
+            self.frames_drawn += 1
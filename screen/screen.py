@@ -1,5 +1,5 @@
 from dataclasses import dataclass, field
-from screen_types import AddressableBWScreen, Renderable
+from screen.screen_types import AddressableBWScreen, Renderable
 
 
 class Screen(Renderable):
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Protocol
+from typing import NamedTuple, Protocol, Union
 
 
 class AddressableBWScreen(Protocol):
@@ -18,16 +18,103 @@ class AddressableBWScreen(Protocol):
     """
     def clear(self) -> None: ...
 
+    """
+    Turns every pixel in the given rectangle on or off.
+    Screens with a packed framebuffer override this with a bulk implementation.
+    """
+    def fill_rect(self, x: int, y: int, width: int, height: int, on: bool) -> None:
+        for xi in range(x, x + width):
+            for yi in range(y, y + height):
+                self.set(xi, yi, on)
+
+    """
+    Draws a bitmap with its top-left corner at (x, y). Pixels outside the bitmap's masks are left untouched.
+    """
+    def draw_bitmap(self, x: int, y: int, bitmap: 'ColumnBitmap') -> None:
+        for xi, (bits, mask) in enumerate(zip(bitmap.bits, bitmap.masks)):
+            for yi in range(mask.bit_length()):
+                if mask >> yi & 1:
+                    self.set(x + xi, y + yi, bool(bits >> yi & 1))
+
+
+class ColumnBitmap:
+    """
+    Monochrome bitmap stored as one bitmask per pixel column, with the top row in the least significant bit.
+
+    `masks` marks which pixels of each column the bitmap covers. Covered pixels are drawn on or off according to `bits`,
+    uncovered ones (e.g. the gaps between characters) are left as they are.
+    Bitmaps are immutable, so they're safe to cache and share between frames.
+    """
+    def __init__(self, bits: tuple[int, ...], masks: tuple[int, ...]):
+        self.bits = bits
+        self.masks = masks
+        self.width = len(bits)
+        self._planes: dict[int, list[tuple[int, int]]] = {}
+
+    def planes(self, shift: int) -> list[tuple[int, int]]:
+        """
+        Returns the bitmap split into 8-pixel-tall page planes when drawn `shift` pixels below a page boundary.
+
+        Each plane is a (bits, mask) pair of little-endian integers with one byte per column,
+        so a packed framebuffer can apply a whole plane to a run of bytes in one operation.
+        """
+        planes = self._planes.get(shift)
+        if planes is None:
+            height = max((mask.bit_length() for mask in self.masks), default=0) + shift
+            planes = [
+                (
+                    int.from_bytes(bytes((bits << shift >> offset) & 0xFF for bits in self.bits), 'little'),
+                    int.from_bytes(bytes((mask << shift >> offset) & 0xFF for mask in self.masks), 'little'),
+                )
+                for offset in range(0, height, 8)
+            ]
+            self._planes[shift] = planes
+        return planes
+
+
+class FillRect(NamedTuple):
+    x: int
+    y: int
+    width: int
+    height: int
+    on: bool
+
+    def draw(self, screen: AddressableBWScreen) -> None:
+        screen.fill_rect(self.x, self.y, self.width, self.height, self.on)
+
+
+class DrawBitmap(NamedTuple):
+    x: int
+    y: int
+    bitmap: ColumnBitmap
+
+    def draw(self, screen: AddressableBWScreen) -> None:
+        screen.draw_bitmap(self.x, self.y, self.bitmap)
+
+
+"""
+Primitive drawing operation that a render tree compiles down to.
+"""
+DrawOp = Union[FillRect, DrawBitmap]
+
 
 class Renderable(Protocol):
     def render(self, screen: AddressableBWScreen) -> None: ...
 
+    """
+    Flattens the renderable into the primitive draw operations that render it.
+    """
+    def compile(self) -> list[DrawOp]: ...
+
 
 class Composition(Renderable, ABC):
     @abstractmethod
     def components(self) -> list[Renderable]:
         pass
 
+    def compile(self):
+        return [op for component in self.components() for op in component.compile()]
+
     def render(self, screen):
-        for component in self.components():
-            component.render(screen)
+        for op in self.compile():
+            op.draw(screen)
@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 
-from screen_types import Renderable
+from screen.screen_types import FillRect, Renderable
 
 
 @dataclass
@@ -12,6 +12,7 @@ class Rectangle(Renderable):
     on: bool
 
     def render(self, screen):
-        for x in range(self.x, self.x + self.width):
-            for y in range(self.y, self.y + self.height):
-                screen.set(x, y, self.on)
+        screen.fill_rect(self.x, self.y, self.width, self.height, self.on)
+
+    def compile(self):
+        return [FillRect(self.x, self.y, self.width, self.height, self.on)]
@@ -1,16 +1,38 @@
 from abc import ABC, abstractmethod
 import logging
-import time
-from typing import Generic, Literal, Protocol, TypedDict, TypeVar
-
-import board
-import busio
-from adafruit_ahtx0 import AHTx0
-from adafruit_scd4x import SCD4X
+from typing import Callable, Generic, Literal, NamedTuple, Optional, Protocol, TypeVar
 
+import clock
 from config import SensorConfig
+from i2c_bus import SHARED_BUS
+from metrics import (
+    SENSOR_DATA_READY_POLLS,
+    SENSOR_READ_FAILURES,
+    SENSOR_READ_SECONDS,
+    SENSOR_READ_TIMEOUTS,
+    SENSOR_SAMPLING_PERIOD_SECONDS,
+)
+
+
+class Reading(Protocol):
+    """
+    A single reading from a sensor.
+
+    Readings are `NamedTuple` records rather than dicts: each read allocates one flat tuple of numbers,
+    monitors fetch fields by attribute instead of hashing string keys, and the fields can be copied
+    straight into history buffers and the reading log.
+
+    Every reading carries the monotonic clock time it was taken at and a per-sensor sequence number.
+    Records are immutable, so a published reading is shared across threads without copying or locking.
+    """
+    @property
+    def timestamp(self) -> float: ...
 
-SensorReading = TypeVar('SensorReading', covariant=True)
+    @property
+    def sequence(self) -> int: ...
+
+
+SensorReading = TypeVar('SensorReading', bound=Reading, covariant=True)
 
 
 class HardwareSensor(Protocol[SensorReading]):
@@ -18,9 +40,32 @@ class HardwareSensor(Protocol[SensorReading]):
 
 
 class Sensor(Generic[SensorReading], ABC):
+    """
+    Name of the sensor, used to label its bus device and metrics.
+    """
+    name: str
+
+    """
+    Record type the sensor's readings are published as.
+    """
+    reading_type: type[tuple]
+
     config: SensorConfig
-    current_reading: SensorReading
-    has_reading: bool
+
+    """
+    Most recently published reading, or None until the first reading is taken.
+    """
+    current_reading: Optional[SensorReading]
+
+    """
+    Whether the most recent attempt to take a reading failed.
+    """
+    failing: bool
+
+    """
+    Monotonic clock time at which the reading currently being taken was started, or None between readings.
+    """
+    read_started_at: Optional[float]
 
     @abstractmethod
     def _build_sensor(self) -> HardwareSensor[SensorReading]: ...
@@ -30,63 +75,206 @@ class Sensor(Generic[SensorReading], ABC):
 
     def __init__(self, config: SensorConfig):
         self.config = config
-        self.has_reading = False
+        # readings are published from the acquisition thread and consumed from the control loop.
+        # Each one is a single immutable record, so swapping the reference is all publishing takes.
+        self.current_reading = None
+        self.failing = False
+        self.read_started_at = None
+        self._sequence = 0
+        self._listeners: list[Callable[[], None]] = []
+        self._read_seconds = SENSOR_READ_SECONDS.labels(sensor=self.name)
+        self._read_failures = SENSOR_READ_FAILURES.labels(sensor=self.name)
+        self._sampling_period = SENSOR_SAMPLING_PERIOD_SECONDS.labels(sensor=self.name)
         self._sensor = self._build_sensor()
 
+    def subscribe(self, listener: Callable[[], None]) -> None:
+        """
+        Registers a callback to be run each time a new reading is published.
+        Callbacks run on the thread that took the reading, so they should return quickly.
+        """
+        self._listeners.append(listener)
+
     def get_current_reading(self) -> SensorReading:
-        if self.has_reading:
-            return self.current_reading
-        raise IOError("No reading available.")
+        reading = self.current_reading
+        if reading is None:
+            raise IOError("No reading available.")
+        return reading
+
+    def get_reading_age(self) -> float:
+        """
+        Seconds since the current reading was taken.
+        Raises an `IOError` if no reading has been taken yet.
+        """
+        return clock.monotonic() - self.get_current_reading().timestamp
+
+    def set_sampling_period(self, period_seconds: float) -> None:
+        """
+        Tells the sensor how long until its next reading will be taken, so it can pick a matching measurement mode.
+        Must be called from the thread that takes the sensor's readings.
+        """
+        self._sampling_period.set(period_seconds)
+
+    def max_wait_seconds(self) -> float:
+        """
+        Longest a healthy read can spend waiting for the sensor to take its next measurement.
+        """
+        return 0.0
+
+    def _reading(self, *values: float) -> SensorReading:
+        """
+        Builds a reading record from the sensor's field values, stamped with the current time and the next sequence number.
+        """
+        self._sequence += 1
+        # builds the tuple directly; the NamedTuple constructor and `_make` are Python-level and take twice as long
+        return tuple.__new__(self.reading_type, (clock.monotonic(), self._sequence, *values))
 
     def get_new_reading(self) -> None:
-        self.current_reading = self.reading_from_sensor()
-        self.has_reading = True
+        started_at = clock.monotonic()
+        self.read_started_at = started_at
+        try:
+            reading = self.reading_from_sensor()
+        except Exception:
+            self.failing = True
+            self._read_failures.inc()
+            raise
+        finally:
+            self.read_started_at = None
+            self._read_seconds.observe(clock.monotonic() - started_at)
+
+        self.current_reading = reading
+        self.failing = False
+
+        for listener in self._listeners:
+            listener()
+
+
+class AHT20Reading(NamedTuple):
+    timestamp: float
+    sequence: int
+    relative_humidity_100: float
+    temp_c: float
 
 
-AHT20Reading = TypedDict('AHT20Reading', {
-    'relative_humidity_100': float,
-    'temp_c': float,
-})
 AHT20ReadingKey = Literal['relative_humidity_100', 'temp_c']
 
 
 class AHT20(Sensor[AHT20Reading]):
+    name = 'aht20'
+    reading_type = AHT20Reading
+
     def _build_sensor(self):
-        return AHTx0(busio.I2C(board.SCL, board.SDA))
+        # drivers are imported on use so sensor types can be imported without the hardware libraries installed
+        from adafruit_ahtx0 import AHTx0
+
+        return AHTx0(SHARED_BUS.device(self.name))
 
     def reading_from_sensor(self):
-        return {
-            'temp_c': self._sensor.temperature,
-            'relative_humidity_100': self._sensor.relative_humidity,
-        }
+        # The driver's `temperature` and `relative_humidity` properties each trigger a full ~80ms measurement cycle.
+        # Trigger a single measurement and decode both fields from the same transaction instead.
+        # Those are driver internals (pinned in pyproject.toml), so fall back to the public properties if they're gone.
+        if not hasattr(self._sensor, '_readdata'):
+            return self._reading(self._sensor.relative_humidity, self._sensor.temperature)
+        self._sensor._readdata()
+        return self._reading(self._sensor._humidity, self._sensor._temp)
+
+
+class SCD41Reading(NamedTuple):
+    timestamp: float
+    sequence: int
+    co2_ppm: float
+    relative_humidity_100: float
+    temp_c: float
 
 
-SCD41Reading = TypedDict('SCD41Reading', {
-    'co2_ppm': float,
-    'relative_humidity_100': float,
-    'temp_c': float,
-})
 SCD41ReadingKey = Literal['co2_ppm', 'relative_humidity_100', 'temp_c']
 
 
 class SCD41(Sensor[SCD41Reading]):
+    name = 'scd41'
+    reading_type = SCD41Reading
+
+    """
+    Sampling periods at least `low_power_period_seconds` long switch the sensor to low power periodic measurement,
+    which takes a measurement every 30s instead of every 5s. It only switches back once the period drops below
+    `normal_power_period_seconds`, since every switch stops measurement and throws away the next sample.
+    """
+    low_power_period_seconds = 30.0
+    normal_power_period_seconds = 20.0
+
+    """
+    Shortest time in normal periodic measurement before switching to low power. Switching back isn't held off,
+    so the sensor speeds up as soon as its readings are needed more often.
+    """
+    min_normal_power_seconds = 600.0
+
+    """
+    Time between measurements in each mode, and how long stopping periodic measurement takes.
+    """
+    measurement_interval_seconds = 5.0
+    low_power_measurement_interval_seconds = 30.0
+    stop_seconds = 0.5
+
+    def __init__(self, config: SensorConfig):
+        self.low_power = False
+        self._mode_switched_at = clock.monotonic()
+        self._data_ready_polls = SENSOR_DATA_READY_POLLS.labels(sensor=self.name)
+        self._read_timeouts = SENSOR_READ_TIMEOUTS.labels(sensor=self.name)
+        super().__init__(config)
+
     def _build_sensor(self):
-        sensor = SCD4X(busio.I2C(board.SCL, board.SDA))
+        from adafruit_scd4x import SCD4X
+
+        sensor = SCD4X(SHARED_BUS.device(self.name))
         sensor.start_periodic_measurement()
         return sensor
 
+    def set_sampling_period(self, period_seconds):
+        super().set_sampling_period(period_seconds)
+        if self.low_power:
+            low_power = period_seconds >= self.normal_power_period_seconds
+        else:
+            low_power = (
+                period_seconds >= self.low_power_period_seconds
+                and clock.monotonic() - self._mode_switched_at >= self.min_normal_power_seconds
+            )
+        if low_power != self.low_power:
+            logging.info(f"Switching SCD-41 to {'low power' if low_power else 'normal'} periodic measurement")
+            self._switch_measurement_mode(low_power)
+            self.low_power = low_power
+            self._mode_switched_at = clock.monotonic()
+
+    def max_wait_seconds(self):
+        # after a mode switch the first measurement is discarded, so the next one is up to two intervals away,
+        # and it's only noticed on the following `data_ready` poll
+        interval = self.low_power_measurement_interval_seconds if self.low_power else self.measurement_interval_seconds
+        return self.stop_seconds + 2 * interval + self.config.poll_interval_seconds
+
+    def _switch_measurement_mode(self, low_power: bool) -> None:
+        # the sensor ignores most commands while measuring, so measurement has to stop before the mode can change
+        self._sensor.stop_periodic_measurement()
+        if low_power:
+            self._sensor.start_low_power_periodic_measurement()
+        else:
+            self._sensor.start_periodic_measurement()
+
     def reading_from_sensor(self):
         time_waited = 0.0
+        polls = 1
         while not self._sensor.data_ready:
             if time_waited > self.config.read_timeout:
+                self._read_timeouts.inc()
                 raise RuntimeError(f"Timed out waiting for SCD-41 reading ({time_waited}s)")
 
             logging.debug("Waiting for SCD-41 to have available reading...")
-            time.sleep(self.config.poll_interval_seconds)
+            clock.sleep(self.config.poll_interval_seconds)
             time_waited += self.config.poll_interval_seconds
+            polls += 1
+        self._data_ready_polls.observe(polls)
 
-        return {
-            'co2_ppm': self._sensor.CO2,
-            'temp_c': self._sensor.temperature,
-            'relative_humidity_100': self._sensor.relative_humidity,
-        }
+        # The driver's measurement properties each re-check `data_ready` before returning their cached field.
+        # Read the measurement once and decode all three fields from that single transaction.
+        # Those are driver internals (pinned in pyproject.toml), so fall back to the public properties if they're gone.
+        if not hasattr(self._sensor, '_read_data'):
+            return self._reading(self._sensor.CO2, self._sensor.relative_humidity, self._sensor.temperature)
+        self._sensor._read_data()
+        return self._reading(self._sensor._co2, self._sensor._relative_humidity, self._sensor._temperature)
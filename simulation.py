@@ -0,0 +1,429 @@
+import argparse
+import csv
+from dataclasses import dataclass, field
+import logging
+from math import exp
+from operator import itemgetter
+import random
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+from adaptive_sampling import AdaptiveSampler
+import clock
+from clock import VirtualClock
+from config import ChamberConfig, GreenhouseConfig, SensorConfig, load_config
+from controller_bank import ControllerBank
+from controller_types import PredictiveController, Settable
+from scheduler import ScheduledTask, Scheduler
+from sensor import AHT20, SCD41, HardwareSensor, Sensor
+from tempcontrol import (
+    attach_filters,
+    controllers,
+    exhaust_controller_config,
+    humidifier_controller_config,
+    monitors,
+    read_monitor,
+    sampler_for,
+    schedule_monitor,
+)
+
+"""
+Faster-than-real-time simulation of the control loop.
+
+Sensors and devices are replaced with simulated backends, driven either by a
+simple physics model of the chamber or by replaying recorded sensor traces,
+and the scheduler runs against a virtual clock that jumps straight from one
+release to the next. Weeks of operation take seconds to simulate:
+
+    python simulation.py --config config.yaml --days 14
+"""
+
+
+@dataclass
+class ChamberModel:
+    """
+    Well-mixed chamber exchanging air with the room around it.
+
+    Between actuator changes every measure relaxes exponentially towards the equilibrium set by its sources
+    and the current air exchange rate, so the model can be advanced by arbitrarily large steps exactly.
+    """
+    humidity_pct: float = 85.0
+    co2_ppm: float = 800.0
+    temp_c: float = 21.0
+    ambient_humidity_pct: float = 45.0
+    ambient_co2_ppm: float = 420.0
+    ambient_temp_c: float = 20.0
+
+    """
+    Air changes per hour through leaks and the passive intake, and additionally while the exhaust fan runs.
+    """
+    passive_air_changes_per_hour: float = 0.5
+    exhaust_air_changes_per_hour: float = 30.0
+
+    fogger_pct_per_minute: float = 3.0
+    co2_production_ppm_per_minute: float = 15.0
+
+    fogger_on: bool = False
+    exhaust_on: bool = False
+    updated_at: float = 0.0
+
+    def advance_to(self, monotonic: float) -> None:
+        seconds = monotonic - self.updated_at
+        if seconds <= 0:
+            return
+        self.updated_at = monotonic
+
+        exchange_rate = (self.passive_air_changes_per_hour + (self.exhaust_air_changes_per_hour if self.exhaust_on else 0.0)) / 3600
+        decay = exp(-exchange_rate * seconds)
+
+        def relax(value: float, ambient: float, source_per_second: float) -> float:
+            equilibrium = ambient + source_per_second / exchange_rate
+            return equilibrium + (value - equilibrium) * decay
+
+        self.co2_ppm = relax(self.co2_ppm, self.ambient_co2_ppm, self.co2_production_ppm_per_minute / 60)
+        fogger_output = self.fogger_pct_per_minute / 60 if self.fogger_on else 0.0
+        self.humidity_pct = min(100.0, relax(self.humidity_pct, self.ambient_humidity_pct, fogger_output))
+        self.temp_c = relax(self.temp_c, self.ambient_temp_c, 0.0)
+
+
+class ChamberProbe(HardwareSensor[dict[str, float]]):
+    """
+    Simulated sensor that reads the chamber model, with optional gaussian noise on each field.
+    """
+    def __init__(self, chamber: ChamberModel, fields: list[str], noise: float = 0.0, seed: Optional[int] = None):
+        self._chamber = chamber
+        self._fields = fields
+        self._noise = noise
+        self._random = random.Random(seed)
+
+    def get_reading(self) -> dict[str, float]:
+        self._chamber.advance_to(clock.monotonic())
+        values = {
+            'co2_ppm': self._chamber.co2_ppm,
+            'temp_c': self._chamber.temp_c,
+            'relative_humidity_100': self._chamber.humidity_pct,
+        }
+        return {
+            name: values[name] + (self._random.gauss(0.0, self._noise) if self._noise else 0.0)
+            for name in self._fields
+        }
+
+
+class TraceReplay(HardwareSensor[dict[str, float]]):
+    """
+    Simulated sensor that replays a recorded CSV trace.
+
+    The trace needs a `seconds` column (offset from the start of the recording) and one column per reading field.
+    Each reading returns the latest row at or before the current virtual time; the last row repeats once the trace runs out.
+    """
+    def __init__(self, path: str):
+        with open(path, newline='') as trace_file:
+            self._rows = [
+                (float(row.pop('seconds')), {name: float(value) for name, value in row.items()})
+                for row in csv.DictReader(trace_file)
+            ]
+        if not self._rows:
+            raise ValueError(f"Trace {path} has no rows")
+        self._index = 0
+        self._started_at: Optional[float] = None
+
+    def get_reading(self) -> dict[str, float]:
+        now = clock.monotonic()
+        if self._started_at is None:
+            self._started_at = now
+        offset = now - self._started_at
+        while self._index + 1 < len(self._rows) and self._rows[self._index + 1][0] <= offset:
+            self._index += 1
+        return self._rows[self._index][1]
+
+
+class SimulatedSensorMixin:
+    def __init__(self, config: SensorConfig, hardware: HardwareSensor[Any]):
+        self._hardware = hardware
+        # the record's first two fields are the timestamp and sequence number the sensor stamps it with
+        self._fields = itemgetter(*self.reading_type._fields[2:])  # type: ignore[attr-defined]
+        super().__init__(config)  # type: ignore[call-arg]
+
+    def _build_sensor(self):
+        return self._hardware
+
+    def reading_from_sensor(self):
+        return self._reading(*self._fields(self._sensor.get_reading()))
+
+
+class SimulatedSCD41(SimulatedSensorMixin, SCD41):
+    """
+    Models the cost of switching measurement mode: stopping periodic measurement takes 500ms,
+    and the first measurement after a restart is discarded, so no new reading is available
+    for two measurement intervals of the new mode.
+
+    The real driver blocks on `data_ready` in the meantime, which is harmless on an acquisition thread
+    but would stall the simulation's single-threaded scheduler. Instead, reads until then return the
+    previous reading again, which consumers see as no new reading.
+    """
+    mode_switches = 0
+    # when the next new reading is available, after a restart
+    ready_at = 0.0
+
+    def _switch_measurement_mode(self, low_power):
+        interval = self.low_power_measurement_interval_seconds if low_power else self.measurement_interval_seconds
+        self.ready_at = clock.monotonic() + self.stop_seconds + 2 * interval
+        self.mode_switches += 1
+
+    def reading_from_sensor(self):
+        if self.current_reading is not None and clock.monotonic() < self.ready_at:
+            return self.current_reading
+        return super().reading_from_sensor()
+
+
+class SimulatedAHT20(SimulatedSensorMixin, AHT20):
+    pass
+
+
+@dataclass
+class SimulatedOutput(Settable):
+    """
+    Simulated device that switches an actuator on the chamber model and tracks its usage.
+    """
+    chamber: ChamberModel
+    actuator: str
+    switches: int = 0
+    on_seconds: float = 0.0
+    state: bool = False
+    _changed_at: float = field(default=0.0, repr=False)
+
+    def set(self, state: bool) -> None:
+        now = clock.monotonic()
+        self.chamber.advance_to(now)
+        self._account(now)
+        if state != self.state:
+            self.switches += 1
+        self.state = state
+        setattr(self.chamber, self.actuator, state)
+
+    def total_on_seconds(self) -> float:
+        self._account(clock.monotonic())
+        return self.on_seconds
+
+    def _account(self, now: float) -> None:
+        if self.state:
+            self.on_seconds += now - self._changed_at
+        self._changed_at = now
+
+
+@dataclass
+class MeasureSummary:
+    minimum: float = float('inf')
+    maximum: float = float('-inf')
+    total: float = 0.0
+    samples: int = 0
+
+    def add(self, value: float) -> None:
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+        self.total += value
+        self.samples += 1
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.samples if self.samples else float('nan')
+
+
+class Simulation:
+    def __init__(
+        self,
+        config: GreenhouseConfig,
+        chamber: Optional[ChamberModel] = None,
+        scd41_hardware: Optional[HardwareSensor[Any]] = None,
+        aht20_hardware: Optional[HardwareSensor[Any]] = None,
+        noise: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        """
+        Installs a virtual clock for the process and builds the same monitors and controllers as `tempcontrol`,
+        backed by simulated sensors and devices. Sensors not given explicit hardware read from the chamber model.
+        """
+        self.clock = VirtualClock()
+        clock.use(self.clock)
+
+        self.chamber = chamber or ChamberModel()
+        self.scd41 = SimulatedSCD41(
+            config.scd41,
+            scd41_hardware or ChamberProbe(self.chamber, ['co2_ppm', 'temp_c', 'relative_humidity_100'], noise, seed),
+        )
+        self.aht20 = SimulatedAHT20(
+            config.aht20,
+            aht20_hardware or ChamberProbe(self.chamber, ['temp_c', 'relative_humidity_100'], noise, seed),
+        )
+        self.outputs = {
+            'humidifier': SimulatedOutput(self.chamber, 'fogger_on'),
+            'exhaust': SimulatedOutput(self.chamber, 'exhaust_on'),
+        }
+        self.controllers = controllers(config, self.aht20, self.scd41, **self.outputs)
+        self.monitors = monitors(self.aht20, self.scd41)
+        attach_filters(config, [*self.controllers.values(), *self.monitors])
+        self.summaries = {
+            'co2_ppm': MeasureSummary(),
+            'relative_humidity_100': MeasureSummary(),
+        }
+
+        self.readings = {'aht20': 0, 'scd41': 0}
+
+        self.scheduler = Scheduler()
+        # sensors are polled by the scheduler here instead of on acquisition threads, so they follow the virtual clock
+        for sensor, sensor_config in [(self.aht20, config.aht20), (self.scd41, config.scd41)]:
+            task = self.scheduler.add(
+                type(sensor).__name__,
+                lambda: None,
+                sensor_config.period_seconds or config.update_interval_seconds,
+            )
+            task.action = self._poll(sensor, task, sampler_for(sensor, sensor_config, self.controllers))
+        for monitor in self.monitors:
+            schedule_monitor(self.scheduler, monitor, read_monitor(monitor), config.update_interval_seconds)
+        for controller in self.controllers.values():
+            schedule_monitor(self.scheduler, controller, controller.control_state, config.update_interval_seconds)
+        self.scheduler.add('summary', self._summarize, config.update_interval_seconds)
+
+    def _poll(self, sensor: Sensor[Any], task: ScheduledTask, sampler: Optional[AdaptiveSampler]) -> Callable[[], None]:
+        def poll():
+            previous_reading = sensor.current_reading
+            sensor.get_new_reading()
+            if sensor.current_reading is previous_reading:
+                if isinstance(sensor, SimulatedSCD41):
+                    # the real sensor's poller blocks on `data_ready` until the restarted measurement comes in,
+                    # so the simulated one retries then instead of waiting out a whole sampling period
+                    task.period_seconds = sensor.ready_at - clock.monotonic()
+                return
+            self.readings[sensor.name] += 1
+            if sampler is not None:
+                # the task's next release is worked out from its period once this returns
+                task.period_seconds = sampler.next_period()
+                sensor.set_sampling_period(task.period_seconds)
+
+        return poll
+
+    def _summarize(self) -> None:
+        reading = self.scd41.get_current_reading()
+        for name, summary in self.summaries.items():
+            summary.add(getattr(reading, name))
+
+    def run(self, seconds: float) -> None:
+        self.scheduler.run_virtual(self.clock, self.clock.monotonic() + seconds)
+
+    def report(self) -> str:
+        elapsed = self.clock.monotonic()
+        lines = [f"Simulated {elapsed / 86400:.2f} days"]
+        for name, output in self.outputs.items():
+            lines.append(
+                f"{name}: {output.switches} switches, "
+                f"on {100 * output.total_on_seconds() / elapsed:.1f}% of the time"
+            )
+        for name, summary in self.summaries.items():
+            lines.append(f"{name}: min {summary.minimum:.1f}, mean {summary.mean:.1f}, max {summary.maximum:.1f}")
+        for name, readings in self.readings.items():
+            lines.append(f"{name}: {readings} readings")
+        lines.append(f"scd41: {self.scd41.mode_switches} measurement mode switches")
+        for name, controller in self.controllers.items():
+            if isinstance(controller, PredictiveController):
+                lines.append(
+                    f"{name}: held off {controller.held_switches} hysteresis switches, "
+                    f"switched early {controller.early_switches} times"
+                )
+        return "\n".join(lines)
+
+
+class MultiChamberSimulation:
+    """
+    Simulates many chambers driven from a single process.
+
+    Each chamber has its own physics model and control settings, and the humidifier and exhaust decisions
+    for every chamber are made together in one vectorized `ControllerBank` step per tick.
+    """
+    def __init__(self, config: GreenhouseConfig, chambers: list[ChamberConfig], noise: float = 0.0, seed: Optional[int] = None):
+        self.clock = VirtualClock()
+        clock.use(self.clock)
+        self.update_interval_seconds = config.update_interval_seconds
+        self.names = [chamber.name for chamber in chambers]
+        self.models = [ChamberModel() for _ in chambers]
+        # controllers are interleaved per chamber: humidifier at 2i, exhaust at 2i + 1
+        self.bank = ControllerBank([
+            controller_config
+            for chamber in chambers
+            for controller_config in (
+                humidifier_controller_config(chamber.humidifier),
+                exhaust_controller_config(chamber.exhaust),
+            )
+        ])
+        self.switches = np.zeros(len(self.bank), dtype=np.int64)
+        self.on_seconds = np.zeros(len(self.bank), dtype=np.float64)
+        self._values = np.empty(len(self.bank), dtype=np.float64)
+        self._noise = noise
+        self._random = np.random.default_rng(seed)
+
+    def tick(self) -> None:
+        now = clock.monotonic()
+        for index, model in enumerate(self.models):
+            model.advance_to(now)
+            self._values[2 * index] = model.humidity_pct
+            self._values[2 * index + 1] = model.co2_ppm
+        if self._noise:
+            self._values += self._random.normal(0.0, self._noise, len(self._values))
+
+        for index in self.bank.step(self._values):
+            model = self.models[index // 2]
+            actuator = 'fogger_on' if index % 2 == 0 else 'exhaust_on'
+            setattr(model, actuator, bool(self.bank.active[index]))
+            self.switches[index] += 1
+
+    def run(self, seconds: float) -> None:
+        until = self.clock.monotonic() + seconds
+        while self.clock.monotonic() < until:
+            self.tick()
+            self.on_seconds += self.bank.active * self.update_interval_seconds
+            self.clock.sleep(self.update_interval_seconds)
+
+    def report(self) -> str:
+        elapsed = self.clock.monotonic()
+        lines = [f"Simulated {len(self.models)} chambers for {elapsed / 86400:.2f} days"]
+        for index, name in enumerate(self.names):
+            humidifier, exhaust = 2 * index, 2 * index + 1
+            lines.append(
+                f"{name}: humidifier {self.switches[humidifier]} switches ({100 * self.on_seconds[humidifier] / elapsed:.1f}% on), "
+                f"exhaust {self.switches[exhaust]} switches ({100 * self.on_seconds[exhaust] / elapsed:.1f}% on)"
+            )
+        return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the control loop against a simulated chamber.")
+    parser.add_argument('--config', default='config.yaml')
+    parser.add_argument('--days', type=float, default=7.0)
+    parser.add_argument('--noise', type=float, default=0.0, help="Standard deviation of gaussian noise added to simulated readings")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--scd41-trace', help="CSV trace to replay in place of the simulated SCD-41")
+    parser.add_argument('--aht20-trace', help="CSV trace to replay in place of the simulated AHT20")
+    parser.add_argument('--chambers', action='store_true', help="Simulate the primary chamber and every configured `chambers` entry together")
+    args = parser.parse_args()
+
+    # per-reading info logs would dominate the runtime of a simulation
+    logging.getLogger().setLevel(logging.WARNING)
+
+    config = load_config(args.config)
+    if args.chambers:
+        simulation = MultiChamberSimulation(
+            config,
+            [ChamberConfig('primary', config.humidifier, config.exhaust), *config.chambers],
+            noise=args.noise,
+            seed=args.seed,
+        )
+    else:
+        simulation = Simulation(
+            config,
+            scd41_hardware=TraceReplay(args.scd41_trace) if args.scd41_trace else None,
+            aht20_hardware=TraceReplay(args.aht20_trace) if args.aht20_trace else None,
+            noise=args.noise,
+            seed=args.seed,
+        )
+    simulation.run(args.days * 86400)
+    print(simulation.report())
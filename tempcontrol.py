@@ -1,26 +1,52 @@
+from dataclasses import fields, replace
 import logging
 import signal
-import time
+from typing import TYPE_CHECKING, Any, Callable, Optional
 
 from prometheus_client import start_http_server
 
-from config import GreenhouseConfig
+from acquisition import AcquisitionEngine
+from actuator import ActuatorDriver, DrivenOutput
+from adaptive_sampling import AdaptiveSampler
+from config import DisplayConfig, ExhaustConfig, GreenhouseConfig, HumidifierConfig, PredictiveConfig, SensorConfig, load_config
+from config_reload import ConfigWatcher
+from filters import FilterPipeline
+from fusion import FusedSource
 from controller import (
     AHTHumidityMonitor,
     CO2Controller,
     HumidityController,
-    PinOutput,
+    PredictiveCO2Controller,
+    PredictiveHumidityController,
     SCDTemperatureMonitor,
     TemperatureMonitor,
 )
-from controller_types import Controller, Monitor
-from sensor import AHT20, SCD41
+from controller_types import (
+    Monitor,
+    MonodirectionalController,
+    MonodirectionalControllerConfig,
+    PredictiveController,
+    PredictiveControllerConfig,
+    Settable,
+)
+from history import HISTORY
+from i2c_bus import SHARED_BUS
+from metrics import UPDATE_INTERVAL_SECONDS
+from reading_log import READING_LOG
+from scheduler import Scheduler
+from sensor import AHT20, SCD41, Sensor
+
+if TYPE_CHECKING:
+    from screen.greenhouse_hud import HudState
+    from screen.renderer import HudRenderer
 
 """
 Control code for managing switching of humidity and CO2 controls.
 Assumes the following:
 * Humidity and CO2 are measured via an SCD-41 sensor connected via the I2C protocol
 
+* Current levels and controller states are optionally shown on an SSD1306-style OLED on the same I2C bus
+
 * Humidity is managed with a humidification device controlled by a single power toggle
     * In our case, an aquarium fogger in a chamber circulated by a waterproof 12V fan
 * Dehumidification will not be necessary
@@ -29,36 +55,85 @@ Assumes the following:
 * CO2 will not need to be increased.
 
 Future features:
-* LED panel controls for displaying current levels/stats
 * Control of target environment levels via knobs/dials (potentiometers are hard)
 """
 logging.basicConfig(level=logging.INFO)
 
 
-def get_config_from_file():
-    return GreenhouseConfig.from_yaml_file('config.yaml')
+CONFIG_PATH = 'config.yaml'
+
+
+def get_config_from_file(path: str = CONFIG_PATH) -> GreenhouseConfig:
+    return load_config(path)
+
+
+def humidifier_controller_config(config: HumidifierConfig) -> MonodirectionalControllerConfig:
+    return {
+        'target_side_of_threshold': 'above',
+        'threshold_value': config.minimum_humidity_pct,
+        'zero_energy_band': config.zero_energy_band,
+    }
+
+
+def exhaust_controller_config(config: ExhaustConfig) -> MonodirectionalControllerConfig:
+    return {
+        'target_side_of_threshold': 'below',
+        'threshold_value': config.maximum_co2_ppm,
+        'zero_energy_band': config.zero_energy_band,
+    }
 
 
-def controllers(aht20: AHT20, scd41: SCD41) -> dict[str, Controller]:
+def predictive_controller_config(config: PredictiveConfig) -> PredictiveControllerConfig:
     return {
-        'humidifier': HumidityController(
-            config={
-                'target_side_of_threshold': 'above',
-                'threshold_value': config.humidifier.minimum_humidity_pct,
-                'zero_energy_band': config.humidifier.zero_energy_band,
-            },
+        'lookahead_seconds': config.lookahead_seconds,
+        'min_on_seconds': config.min_on_seconds,
+        'min_off_seconds': config.min_off_seconds,
+        'rate_window_seconds': config.rate_window_seconds,
+    }
+
+
+def humidity_source(config: GreenhouseConfig, aht20: AHT20, scd41: SCD41) -> FusedSource:
+    """
+    Source the humidifier is controlled from: the SCD-41, fused with the AHT20 when `humidity_fusion` is configured.
+    """
+    inputs: list[tuple[Sensor[Any], str]] = [(scd41, 'relative_humidity_100')]
+    if config.humidity_fusion is not None:
+        inputs.append((aht20, 'relative_humidity_100'))
+    return FusedSource(HumidityController.measure_name, inputs, config.humidity_fusion)
+
+
+def controllers(config: GreenhouseConfig, aht20: AHT20, scd41: SCD41, humidifier: Settable, exhaust: Settable) -> dict[str, MonodirectionalController]:
+    if config.humidifier.predictive is None:
+        humidifier_controller = HumidityController(
+            config=humidifier_controller_config(config.humidifier),
+            source=humidity_source(config, aht20, scd41),
+            device=humidifier,
+        )
+    else:
+        humidifier_controller = PredictiveHumidityController(
+            config=humidifier_controller_config(config.humidifier),
+            source=humidity_source(config, aht20, scd41),
+            device=humidifier,
+            predictive=predictive_controller_config(config.humidifier.predictive),
+        )
+
+    if config.exhaust.predictive is None:
+        exhaust_controller = CO2Controller(
+            config=exhaust_controller_config(config.exhaust),
             sensor=scd41,
-            device=PinOutput(config.humidifier.gpio_pin_id),
-        ),
-        'exhaust': CO2Controller(
-            config={
-                'target_side_of_threshold': 'below',
-                'threshold_value': config.exhaust.maximum_co2_ppm,
-                'zero_energy_band': config.exhaust.zero_energy_band,
-            },
+            device=exhaust,
+        )
+    else:
+        exhaust_controller = PredictiveCO2Controller(
+            config=exhaust_controller_config(config.exhaust),
             sensor=scd41,
-            device=PinOutput(config.exhaust.gpio_pin_id),
-        ),
+            device=exhaust,
+            predictive=predictive_controller_config(config.exhaust.predictive),
+        )
+
+    return {
+        'humidifier': humidifier_controller,
+        'exhaust': exhaust_controller,
     }
 
 
@@ -76,43 +151,239 @@ def monitors(aht20: AHT20, scd41: SCD41) -> list[Monitor]:
     ]
 
 
+def attach_filters(config: GreenhouseConfig, measure_monitors: list[Monitor]) -> None:
+    """
+    Sets up the configured filters on the monitors of each filtered measure.
+    """
+    by_measure = {monitor.measure_name: monitor for monitor in measure_monitors}
+    for measure, filter_config in config.filters.items():
+        if measure not in by_measure:
+            logging.warning(f"Ignoring filters for unknown measure {measure}, expected one of {', '.join(by_measure)}")
+            continue
+        by_measure[measure].filters = FilterPipeline.from_config(measure, filter_config)
+
+
+def sampler_for(
+    sensor: Sensor[Any],
+    config: SensorConfig,
+    device_controllers: dict[str, MonodirectionalController],
+) -> Optional[AdaptiveSampler]:
+    """
+    Adaptive sampler for a sensor, driven by the controllers that act on its readings, if it's configured for one.
+    """
+    if config.adaptive is None:
+        return None
+    return AdaptiveSampler(
+        config.adaptive,
+        [controller for controller in device_controllers.values() if sensor in controller.sensors()],
+    )
+
+
+def apply_config(
+    running: GreenhouseConfig,
+    new: GreenhouseConfig,
+    device_controllers: dict[str, MonodirectionalController],
+) -> GreenhouseConfig:
+    """
+    Updates the controllers whose settings differ between the running and new configs.
+    Settings that only take effect on startup are left alone, with a warning that a restart is needed.
+
+    Returns the config now in effect: the running config with only the settings that were applied live taken from the new one.
+    """
+    applied = {}
+    for name, controller_config in (
+        ('humidifier', humidifier_controller_config(new.humidifier)),
+        ('exhaust', exhaust_controller_config(new.exhaust)),
+    ):
+        controller = device_controllers[name]
+        if controller.config != controller_config:
+            logging.info(f"Updating {name} controller config from {controller.config} to {controller_config}")
+            controller.update_config(controller_config)
+
+        running_device, new_device = getattr(running, name), getattr(new, name)
+        duty_cycle = running_device.duty_cycle
+        device = getattr(controller, 'device', None)
+        if isinstance(device, DrivenOutput):
+            duty_cycle = new_device.duty_cycle
+            if device.on_duty_cycle != duty_cycle:
+                logging.info(f"Updating {name} duty cycle from {device.on_duty_cycle:.0%} to {duty_cycle:.0%}")
+                device.set_on_duty_cycle(duty_cycle)
+
+        predictive = running_device.predictive
+        if isinstance(controller, PredictiveController) and new_device.predictive is not None:
+            predictive = new_device.predictive
+            predictive_config = predictive_controller_config(predictive)
+            if controller.predictive != predictive_config:
+                logging.info(f"Updating {name} predictive config from {controller.predictive} to {predictive_config}")
+                controller.predictive = predictive_config
+
+        # the pin is only claimed on startup, so it stays as it was
+        applied[name] = replace(new_device, gpio_pin_id=running_device.gpio_pin_id, duty_cycle=duty_cycle, predictive=predictive)
+
+    needs_restart = [
+        f.name for f in fields(GreenhouseConfig)
+        if f.name not in ('humidifier', 'exhaust') and getattr(running, f.name) != getattr(new, f.name)
+    ]
+    needs_restart += [
+        f"{name}.gpio_pin_id" for name in ('humidifier', 'exhaust')
+        if getattr(running, name).gpio_pin_id != getattr(new, name).gpio_pin_id
+    ]
+    needs_restart += [
+        f"{name}.predictive" for name in ('humidifier', 'exhaust')
+        # switching between controller engines means building a new controller
+        if (getattr(running, name).predictive is None) != (getattr(new, name).predictive is None)
+    ]
+    if needs_restart:
+        logging.warning(f"Changes to {', '.join(needs_restart)} only take effect after a restart")
+
+    return replace(running, **applied)
+
+
+def apply_pending_config(
+    watcher: ConfigWatcher,
+    running: GreenhouseConfig,
+    device_controllers: dict[str, MonodirectionalController],
+) -> Callable[[], None]:
+    def apply():
+        nonlocal running
+        new = watcher.take_pending()
+        if new is None or new == running:
+            return
+        running = apply_config(running, new, device_controllers)
+
+    return apply
+
+
+def hud_state(device_controllers: dict[str, MonodirectionalController]) -> 'HudState':
+    """
+    Snapshot of the latest readings and controller states for the HUD.
+    Raises an `IndexError` until every displayed measure has a reading.
+    """
+    from screen.greenhouse_hud import HudState, MetricState
+
+    humidifier = device_controllers['humidifier']
+    exhaust = device_controllers['exhaust']
+    _, temp_c = HISTORY.series('temp').latest()
+    return HudState(
+        co2=MetricState(
+            current=HISTORY.series(exhaust.measure_name).latest()[1],
+            target=exhaust.config['threshold_value'],
+            controller_running=exhaust.active,
+        ),
+        humidity=MetricState(
+            current=HISTORY.series(humidifier.measure_name).latest()[1],
+            target=humidifier.config['threshold_value'],
+            controller_running=humidifier.active,
+        ),
+        temp=temp_c * 9 / 5 + 32,
+    )
+
+
+def update_display(renderer: 'HudRenderer', device_controllers: dict[str, MonodirectionalController]) -> Callable[[], None]:
+    def update():
+        try:
+            renderer.submit(hud_state(device_controllers))
+        except IndexError:
+            logging.debug("Not all readings are available for the display yet")
+
+    return update
+
+
+def start_display(config: DisplayConfig, scheduler: Scheduler, device_controllers: dict[str, MonodirectionalController]) -> None:
+    # the display stack is only imported when there's a display to drive, keeping it off the startup path otherwise
+    from screen.oled import SSD1306Display
+    from screen.renderer import HudRenderer
+
+    renderer = HudRenderer(
+        SSD1306Display(
+            SHARED_BUS.device('display'),
+            address=config.i2c_address,
+            width=config.width,
+            height=config.height,
+        ),
+        max_fps=config.max_fps,
+    )
+    renderer.start()
+    scheduler.add('display', update_display(renderer, device_controllers), period_seconds=1.0 / config.max_fps)
+
+
+def read_monitor(monitor: Monitor) -> Callable[[], None]:
+    def read():
+        logging.debug(f"Fetching value from {monitor.measure_name} monitor...")
+        try:
+            monitor.read_value()
+        except IOError:
+            logging.warning(f"No value available yet for {monitor.measure_name}")
+            return
+        logging.debug("Done.")
+
+    return read
+
+
+def schedule_monitor(scheduler: Scheduler, monitor: Monitor, action: Callable[[], None], default_period_seconds: float) -> None:
+    period_seconds = monitor.period_seconds or default_period_seconds
+    trigger = getattr(monitor, 'sensor', None) if monitor.wake_on_reading else None
+    if trigger is not None and trigger.config.adaptive is not None:
+        # adaptively sampled sensors can go quiet for up to their longest period without anything being wrong
+        period_seconds = max(period_seconds, trigger.config.adaptive.max_period_seconds)
+    scheduler.add(
+        monitor.measure_name,
+        action,
+        period_seconds=period_seconds,
+        deadline_seconds=monitor.deadline_seconds,
+        trigger=trigger,
+    )
+
+
 if __name__ == '__main__':
     config = get_config_from_file()
+    if config.chambers:
+        logging.warning(f"Ignoring {len(config.chambers)} `chambers` entries: additional chambers are only driven by simulation.py for now")
+    HISTORY.configure(config.history_capacity)
+    if config.reading_log is not None:
+        READING_LOG.open(
+            config.reading_log.path,
+            config.reading_log.segment_bytes,
+            config.reading_log.segments_kept,
+            config.reading_log.flush_interval_seconds,
+        )
     start_http_server(config.metrics_server_port)
+    UPDATE_INTERVAL_SECONDS.set(config.update_interval_seconds)
     scd41 = SCD41(config.scd41)
     aht20 = AHT20(config.aht20)
-    device_controllers = controllers(aht20, scd41)
+    actuators = ActuatorDriver(config.actuator.window_seconds, config.actuator.min_pulse_seconds)
+    device_controllers = controllers(
+        config,
+        aht20,
+        scd41,
+        humidifier=actuators.output('humidifier', config.humidifier.gpio_pin_id, config.humidifier.duty_cycle),
+        exhaust=actuators.output('exhaust_fan', config.exhaust.gpio_pin_id, config.exhaust.duty_cycle),
+    )
     measure_monitors = monitors(aht20, scd41)
+    attach_filters(config, [*device_controllers.values(), *measure_monitors])
+    acquisition = AcquisitionEngine()
+    for sensor, sensor_config in [(aht20, config.aht20), (scd41, config.scd41)]:
+        acquisition.add_sensor(
+            sensor,
+            sensor_config.period_seconds or config.update_interval_seconds,
+            sampler_for(sensor, sensor_config, device_controllers),
+        )
 
-    def reload_device_config(_signum, _frame):
-        config = get_config_from_file()
-        device_controllers['humidifier'].set_config({
-            'target_side_of_threshold': 'above',
-            'threshold_value': config.humidifier.minimum_humidity_pct,
-            'zero_energy_band': config.humidifier.zero_energy_band,
-        })
-        device_controllers['exhaust'].set_config({
-            'target_side_of_threshold': 'below',
-            'threshold_value': config.exhaust.maximum_co2_ppm,
-            'zero_energy_band': config.exhaust.zero_energy_band,
-        })
-
-    signal.signal(signal.SIGHUP, reload_device_config)
-
-    while True:
-        logging.debug("Getting new readings...")
-        aht20.get_new_reading()
-        scd41.get_new_reading()
-        logging.debug("Got readings.")
-
-        for monitor in measure_monitors:
-            logging.debug(f"Fetching value from {monitor.measure_name} monitor...")
-            monitor.read_value()
-            logging.debug("Done.")
+    config_watcher = ConfigWatcher(CONFIG_PATH, get_config_from_file)
+    signal.signal(signal.SIGHUP, lambda _signum, _frame: config_watcher.request_reload())
+    config_watcher.start()
+    actuators.start()
+    acquisition.start()
+
+    scheduler = Scheduler()
+    for monitor in measure_monitors:
+        schedule_monitor(scheduler, monitor, read_monitor(monitor), config.update_interval_seconds)
+    for controller in device_controllers.values():
+        schedule_monitor(scheduler, controller, controller.control_state, config.update_interval_seconds)
+    # new configs are swapped in by the control loop itself, so they never land in the middle of a tick
+    scheduler.add('config', apply_pending_config(config_watcher, config, device_controllers), period_seconds=1.0)
 
-        for _, controller in device_controllers.items():
-            logging.debug(f"Updating state for {controller.device_name} controller...")
-            controller.control_state()
-            logging.debug("Done.")
+    if config.display is not None:
+        start_display(config.display, scheduler, device_controllers)
 
-        time.sleep(config.update_interval_seconds)
+    scheduler.run_forever()